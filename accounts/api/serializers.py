@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from accounts.dtos import UserCard
 from accounts.models import UserProfile
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -14,6 +15,12 @@ class UserSerializerWithProfile(UserSerializer):
     nickname = serializers.CharField(source='profile.nickname')
     avatar_url = serializers.SerializerMethodField()
 
+    def to_representation(self, instance):
+        # User cards carry the rendered fields already
+        if isinstance(instance, UserCard):
+            return instance.to_dict()
+        return super(UserSerializerWithProfile, self).to_representation(instance)
+
     def get_avatar_url(self, obj):
         if obj.profile.avatar:
             return obj.profile.avatar.url
@@ -0,0 +1,38 @@
+class UserCard:
+    # What lists render for a user, cached as a tuple instead of a pickled User and profile
+    __slots__ = ('id', 'username', 'nickname', 'avatar_url')
+
+    def __init__(self, id, username, nickname=None, avatar_url=None):
+        self.id = id
+        self.username = username
+        self.nickname = nickname
+        self.avatar_url = avatar_url
+
+    @classmethod
+    def from_user(cls, user, profile):
+        avatar_url = profile.avatar.url if profile.avatar else None
+        return cls(user.id, user.username, profile.nickname, avatar_url)
+
+    @classmethod
+    def load_many(cls, user_ids):
+        from accounts.services import UserService
+        from django.contrib.auth.models import User
+
+        users = User.objects.filter(id__in=user_ids)
+        profiles = UserService.get_profiles_via_cache([user.id for user in users])
+        return {user.id: cls.from_user(user, profiles[user.id]) for user in users}
+
+    def encode(self):
+        return self.id, self.username, self.nickname, self.avatar_url
+
+    @classmethod
+    def decode(cls, values):
+        return cls(*values)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'nickname': self.nickname,
+            'avatar_url': self.avatar_url,
+        }
@@ -1,3 +1,15 @@
-def profile_changed(sender, instance, **kwargs):
+def profile_changed(sender, instance, created=False, **kwargs):
     from accounts.services import UserService
+    # Profiles created lazily, e.g. by the friendship counts, hold nothing of the card yet
+    if created and not instance.nickname and not instance.avatar:
+        UserService.invalidate_cached_profile(instance.user_id)
+        return
     UserService.invalidate_profile(instance.user_id)
+
+
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    from accounts.services import UserService
+    # Logging in only updates last_login, which is not on the card
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    UserService.invalidate_user_card(instance.id)
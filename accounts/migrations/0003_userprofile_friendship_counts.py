@@ -0,0 +1,63 @@
+# Generated by Django 4.2 on 2026-10-18 18:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def backfill_friendship_counts(apps, schema_editor):
+    # Profiles are created lazily, users who have friendships but no profile get one
+    # here so that the counts of every user with friendships are kept by the listener
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    Friendship = apps.get_model('friendships', 'Friendship')
+
+    counts = {}
+    rows = Friendship.objects.filter(to_user_id__isnull=False) \
+        .values('to_user_id') \
+        .annotate(count=Count('id'))
+    for row in rows:
+        counts.setdefault(row['to_user_id'], {})['followers_count'] = row['count']
+    rows = Friendship.objects.filter(from_user_id__isnull=False) \
+        .values('from_user_id') \
+        .annotate(count=Count('id'))
+    for row in rows:
+        counts.setdefault(row['from_user_id'], {})['followings_count'] = row['count']
+
+    profiles = []
+    for profile in UserProfile.objects.filter(user_id__in=counts.keys()).iterator():
+        user_counts = counts.pop(profile.user_id)
+        profile.followers_count = user_counts.get('followers_count', 0)
+        profile.followings_count = user_counts.get('followings_count', 0)
+        profiles.append(profile)
+    UserProfile.objects.bulk_update(profiles, ['followers_count', 'followings_count'], batch_size=BATCH_SIZE)
+    UserProfile.objects.bulk_create([
+        UserProfile(
+            user_id=user_id,
+            followers_count=user_counts.get('followers_count', 0),
+            followings_count=user_counts.get('followings_count', 0),
+        )
+        for user_id, user_counts in counts.items()
+    ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_userprofile_id'),
+        ('friendships', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='followings_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+        migrations.RunPython(backfill_friendship_counts, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
-from accounts.listeners import profile_changed
+from accounts.listeners import profile_changed, user_changed
 from utils.listeners import invalidate_object_cache
 from django.db.models.signals import pre_delete, post_save
 
+PROFILE_COUNT_FIELDS = ('followers_count', 'followings_count')
+
 
 class UserProfile(models.Model):
     id = models.AutoField(primary_key=True)
@@ -13,9 +15,23 @@ class UserProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Add following fields to achieve denormalized followers_count and followings_count
+    followers_count = models.IntegerField(default=0, null=True)
+    followings_count = models.IntegerField(default=0, null=True)
+
     def __str__(self):
         return '{} {}'.format(self.user, self.nickname)
 
+    def save(self, *args, **kwargs):
+        # Counts are only changed by the F() updates of FriendshipServices, a full save of a
+        # profile loaded earlier would write stale counts back
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in PROFILE_COUNT_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 def get_profile(user):
 
@@ -37,3 +53,5 @@ post_save.connect(profile_changed, sender=UserProfile)
 
 pre_delete.connect(invalidate_object_cache, sender=User)
 post_save.connect(invalidate_object_cache, sender=User)
+pre_delete.connect(user_changed, sender=User)
+post_save.connect(user_changed, sender=User)
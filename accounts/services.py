@@ -1,7 +1,10 @@
+from accounts.dtos import UserCard
 from accounts.models import UserProfile
 from django.conf import settings
 from django.core.cache import caches
-from twitter.cache import USER_PROFILE_PATTERN
+from twitter.cache import USER_CARD_VERSION_PATTERN, USER_PROFILE_PATTERN
+from utils.memcached_helper import MemcachedHelper
+from utils.redis_client import RedisClient
 
 cache = caches['testing'] if settings.TESTING else caches['default']
 
@@ -22,6 +25,56 @@ class UserService:
         return profile
 
     @classmethod
-    def invalidate_profile(cls, user_id):
+    def get_profiles_via_cache(cls, user_ids):
+        keys = {USER_PROFILE_PATTERN.format(user_id=user_id): user_id for user_id in user_ids}
+        cached_profiles = cache.get_many(keys.keys())
+        profiles = {keys[key]: profile for key, profile in cached_profiles.items()}
+
+        # Cache missed
+        missed_user_ids = [user_id for user_id in keys.values() if user_id not in profiles]
+        if not missed_user_ids:
+            return profiles
+        missed_profiles = {
+            profile.user_id: profile
+            for profile in UserProfile.objects.filter(user_id__in=missed_user_ids)
+        }
+        for user_id in missed_user_ids:
+            if user_id not in missed_profiles:
+                missed_profiles[user_id], _ = UserProfile.objects.get_or_create(user_id=user_id)
+        cache.set_many({
+            USER_PROFILE_PATTERN.format(user_id=user_id): profile
+            for user_id, profile in missed_profiles.items()
+        })
+        profiles.update(missed_profiles)
+        return profiles
+
+    @classmethod
+    def invalidate_cached_profile(cls, user_id):
+        # Only the cached profile, for changes of fields which are not on the card
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
         cache.delete(key)
+
+    @classmethod
+    def invalidate_profile(cls, user_id):
+        cls.invalidate_cached_profile(user_id)
+        cls.invalidate_user_card(user_id)
+
+    @classmethod
+    def get_user_cards(cls, user_ids):
+        return MemcachedHelper.get_dtos_via_cache(UserCard, user_ids)
+
+    @classmethod
+    def get_user_card_versions(cls, user_ids):
+        # Versions live in Redis without expiry, so they are not lost to memcached eviction
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        conn = RedisClient.get_connection('counters')
+        versions = conn.mget([USER_CARD_VERSION_PATTERN.format(user_id=user_id) for user_id in user_ids])
+        return {user_id: int(version or 0) for user_id, version in zip(user_ids, versions)}
+
+    @classmethod
+    def invalidate_user_card(cls, user_id):
+        MemcachedHelper.invalidate_cache(UserCard, user_id)
+        conn = RedisClient.get_connection('counters')
+        conn.incr(USER_CARD_VERSION_PATTERN.format(user_id=user_id))
@@ -1,4 +1,6 @@
+from accounts.dtos import UserCard
 from accounts.models import UserProfile
+from accounts.services import UserService
 from testing.testcases import TestCase
 
 
@@ -11,3 +13,31 @@ class UserProfileTests(TestCase):
         p = zhekang.profile
         self.assertEqual(isinstance(p, UserProfile), True)
         self.assertEqual(UserProfile.objects.count(), 1)
+
+    def test_user_cards(self):
+        self.clear_cache()
+        zhekang = self.create_user('zhekang')
+        zhekang.profile.nickname = 'zk'
+        zhekang.profile.save()
+
+        # Cards are built in batch on cache miss and decoded from cache afterwards
+        with self.assertNumQueries(2):
+            cards = UserService.get_user_cards([zhekang.id])
+        with self.assertNumQueries(0):
+            cards = UserService.get_user_cards([zhekang.id])
+        self.assertIsInstance(cards[zhekang.id], UserCard)
+        self.assertEqual(cards[zhekang.id].to_dict(), {
+            'id': zhekang.id,
+            'username': 'zhekang',
+            'nickname': 'zk',
+            'avatar_url': None,
+        })
+
+        # Profile and user changes invalidate the cached card
+        profile = UserProfile.objects.get(user=zhekang)
+        profile.nickname = 'zhekang peng'
+        profile.save()
+        self.assertEqual(UserService.get_user_cards([zhekang.id])[zhekang.id].nickname, 'zhekang peng')
+        zhekang.username = 'zhekangpeng'
+        zhekang.save()
+        self.assertEqual(UserService.get_user_cards([zhekang.id])[zhekang.id].username, 'zhekangpeng')
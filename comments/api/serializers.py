@@ -1,14 +1,32 @@
+from django.db import models
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from accounts.api.serializers import UserSerializerForComment
 from comments.models import Comment
+from comments.services import CommentService
 from likes.services import LikeServices
 from tweets.models import Tweet
+from utils.redis_helper import RedisHelper
+
+
+def hydrate_comments(comments, context):
+    # Load the fields of all comments up front, CommentSerializer reads them from context
+    hydrated_comments = CommentService.hydrate_comments(comments, context['request'].user)
+    context.setdefault('hydrated_comments', {}).update(hydrated_comments)
+
+
+class CommentListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        comments = list(iterable)
+        hydrate_comments(comments, self.context)
+        return super(CommentListSerializer, self).to_representation(comments)
 
 
 class CommentSerializer(serializers.ModelSerializer):
 
-    user = UserSerializerForComment()
+    user = UserSerializerForComment(source='cached_user')
     like_count = serializers.SerializerMethodField()
     has_liked = serializers.SerializerMethodField()
 
@@ -24,12 +42,24 @@ class CommentSerializer(serializers.ModelSerializer):
             'like_count',
             'has_liked',
         )
+        list_serializer_class = CommentListSerializer
+
+    def get_hydrated_field(self, obj, field_name):
+        hydrated_comment = self.context.get('hydrated_comments', {}).get(obj.id)
+        if hydrated_comment is None:
+            return None
+        return hydrated_comment[field_name]
 
     def get_like_count(self, obj):
-        count = obj.like_set.count()
-        return count
+        hydrated_count = self.get_hydrated_field(obj, 'like_count')
+        if hydrated_count is not None:
+            return hydrated_count
+        return RedisHelper.get_count(obj, 'likes_count')
 
     def get_has_liked(self, obj):
+        hydrated_has_liked = self.get_hydrated_field(obj, 'has_liked')
+        if hydrated_has_liked is not None:
+            return hydrated_has_liked
         return LikeServices.has_liked(self.context['request'].user, obj)
 
 
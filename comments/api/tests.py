@@ -1,7 +1,10 @@
 from comments.models import Comment
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from utils.paginations import EndlessPagination
 
 
 COMMENT_URL = '/api/comments/'
@@ -112,27 +115,111 @@ class CommentApiTests(TestCase):
         response = self.anonymous_client.get(COMMENT_URL)
         self.assertEqual(response.status_code, 400)
 
+        # tweet_id must be a number
+        response = self.anonymous_client.get(COMMENT_URL, {'tweet_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tweet_id', response.data['errors'])
+
         # Valid GET request
         url = '{}?tweet_id={}'.format(COMMENT_URL, self.tweet.id)
         response = self.anonymous_client.get(url)
         self.assertEqual(response.status_code, 200)
 
         # No comments at the beginning
-        self.assertEqual(len(response.data['comments']), 0)
+        self.assertEqual(len(response.data['results']), 0)
 
-        # Comments are ordered based on created_at
+        # Comments are ordered by created_at, newest first
         self.create_comment(self.xiaohe, self.tweet.id, content="First")
         self.create_comment(self.zhekang, self.tweet.id, content="Second")
         self.create_comment(self.xiaohe, self.create_tweet(self.xiaohe).id, content="Third")
         response = self.anonymous_client.get(url)
-        self.assertEqual(len(response.data['comments']), 2)
-        self.assertEqual(response.data['comments'][0]['content'], "First")
-        self.assertEqual(response.data['comments'][1]['content'], "Second")
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['content'], "Second")
+        self.assertEqual(response.data['results'][1]['content'], "First")
 
         # Only tweet_id takes effect in filtering
         response = self.anonymous_client.get(COMMENT_URL, {'tweet_id': self.tweet.id, 'user_id': self.zhekang.id})
-        self.assertEqual(len(response.data['comments']), 2)
+        self.assertEqual(len(response.data['results']), 2)
         
+    def test_list_has_liked(self):
+        comments = [self.create_comment(self.zhekang, self.tweet.id) for _ in range(3)]
+        self.create_like(self.xiaohe, comments[0])
+        self.create_like(self.xiaohe, comments[2])
+        self.create_like(self.zhekang, comments[1])
+
+        url = '{}?tweet_id={}'.format(COMMENT_URL, self.tweet.id)
+        response = self.xiaohe_client.get(url)
+        has_liked = [comment['has_liked'] for comment in response.data['results']]
+        self.assertEqual(has_liked, [True, False, True])
+        response = self.anonymous_client.get(url)
+        has_liked = [comment['has_liked'] for comment in response.data['results']]
+        self.assertEqual(has_liked, [False, False, False])
+
+    def _list_comments_with_query_count(self, url):
+        # Warm up caches first, then count DB queries of the cached request
+        self.anonymous_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.anonymous_client.get(url)
+        return response.data['results'], len(queries)
+
+    def test_list_like_count(self):
+        url = '{}?tweet_id={}'.format(COMMENT_URL, self.tweet.id)
+        comment = self.create_comment(self.zhekang, self.tweet.id)
+        self.create_like(self.xiaohe, comment)
+        comments, query_count = self._list_comments_with_query_count(url)
+        self.assertEqual([c['like_count'] for c in comments], [1])
+
+        comment = self.create_comment(self.xiaohe, self.tweet.id)
+        self.create_like(self.xiaohe, comment)
+        self.create_like(self.zhekang, comment)
+        self.create_comment(self.xiaohe, self.tweet.id)
+
+        # Counts are read from Redis in batch instead of COUNT(*) per comment
+        comments, more_query_count = self._list_comments_with_query_count(url)
+        self.assertEqual([c['like_count'] for c in comments], [0, 2, 1])
+        self.assertEqual(more_query_count, query_count)
+
+    def test_list_pagination(self):
+        page_size = EndlessPagination.page_size
+        comments = [
+            self.create_comment(self.create_user('user{}'.format(i)), self.tweet.id)
+            for i in range(page_size - 5)
+        ]
+        url = '{}?tweet_id={}'.format(COMMENT_URL, self.tweet.id)
+
+        # Comments are read from the cache, users and counts are loaded in batch
+        self.anonymous_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.anonymous_client.get(url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(
+            [comment['id'] for comment in response.data['results']],
+            [comment.id for comment in comments[::-1]],
+        )
+        self.assertEqual(response.data['results'][0]['user']['id'], comments[-1].user_id)
+
+        # Pages continue from the cursor
+        comments += [
+            self.create_comment(self.create_user('user{}'.format(i)), self.tweet.id)
+            for i in range(page_size - 5, page_size + 5)
+        ]
+        response = self.anonymous_client.get(url)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [comment['id'] for comment in response.data['results']],
+            [comment.id for comment in comments[::-1][:page_size]],
+        )
+        response = self.anonymous_client.get(COMMENT_URL, {
+            'tweet_id': self.tweet.id,
+            'cursor': response.data['next_cursor'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(
+            [comment['id'] for comment in response.data['results']],
+            [comment.id for comment in comments[::-1][page_size:]],
+        )
+
     def test_comments_count_with_cache(self):
         tweet_url = '/api/tweets/{}/'.format(self.tweet.id)
         response = self.zhekang_client.get(tweet_url)
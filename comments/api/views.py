@@ -1,3 +1,4 @@
+from functools import partial
 from django.utils.decorators import method_decorator
 from django_ratelimit.decorators import ratelimit
 from rest_framework import viewsets, status
@@ -9,8 +10,10 @@ from comments.api.serializers import (
     CommentSerializerForUpdate,
 )
 from comments.models import Comment
+from comments.services import CommentService
 from inbox.services import NotificationService
 from utils.decorators import required_params
+from utils.paginations import EndlessPagination
 from utils.permissions import IsObjectOwner
 
 
@@ -18,6 +21,7 @@ class CommentViewSet(viewsets.GenericViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializerForCreate
     filterset_fields = ('tweet_id',)
+    pagination_class = EndlessPagination
 
     def get_permissions(self):
         if self.action == 'create':
@@ -64,7 +68,22 @@ class CommentViewSet(viewsets.GenericViewSet):
     @required_params(method='GET', params=['tweet_id'])
     @method_decorator(ratelimit(key='user', rate='10/s', method='GET', block=True))
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        comments = self.filter_queryset(queryset).prefetch_related('user').order_by('created_at')
-        serializer = CommentSerializer(instance=comments, many=True, context={'request': request})
-        return Response({'comments': serializer.data}, status=status.HTTP_200_OK)
\ No newline at end of file
+        # tweet_id goes straight to the cache and the ORM, so it has to be a number
+        try:
+            tweet_id = int(request.query_params['tweet_id'])
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': "Please check input",
+                'errors': {'tweet_id': ["A valid integer is required."]},
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Comments are listed newest first, pages are read from the cached sorted set
+        page = self.paginator.paginate_cached_range(
+            partial(CommentService.get_cached_comments_range, tweet_id),
+            request,
+        )
+        if page is None:
+            page = self.paginate_queryset(CommentService.get_tweet_comments_queryset(tweet_id))
+        serializer = CommentSerializer(page, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
@@ -3,17 +3,35 @@ from utils.redis_helper import RedisHelper
 
 def incr_comments_count(sender, instance, created, **kwargs):
     from tweets.models import Tweet
-    from django.db.models import F
 
     if not created:
         return
-    Tweet.objects.filter(id=instance.tweet_id).update(comments_count=F('comments_count') + 1)
-    RedisHelper.incr_count(instance.tweet, 'comments_count')
+    # The DB row is updated by RedisHelper, later by the flush task in write-behind mode.
+    # Only the id is needed to reach the counter, skip loading the tweet
+    RedisHelper.incr_count(Tweet(id=instance.tweet_id), 'comments_count')
 
 
 def decr_comments_count(sender, instance, **kwargs):
     from tweets.models import Tweet
-    from django.db.models import F
 
-    Tweet.objects.filter(id=instance.tweet_id).update(comments_count=F('comments_count') - 1)
-    RedisHelper.decr_count(instance.tweet, 'comments_count')
+    RedisHelper.decr_count(Tweet(id=instance.tweet_id), 'comments_count')
+
+
+def push_comment_to_cache(sender, instance, created, **kwargs):
+    from comments.services import CommentService
+
+    # Comments left by a deleted tweet are not listed anywhere
+    if instance.tweet_id is None:
+        return
+    if not created:
+        CommentService.update_comment_in_cache(instance)
+        return
+    CommentService.push_comment_to_cache(instance)
+
+
+def remove_comment_from_cache(sender, instance, **kwargs):
+    from comments.services import CommentService
+
+    if instance.tweet_id is None:
+        return
+    CommentService.remove_comment_from_cache(instance)
@@ -4,8 +4,13 @@ from tweets.models import Tweet
 from likes.models import Like
 from django.contrib.contenttypes.models import ContentType
 from utils.memcached_helper import MemcachedHelper
-from django.db.models.signals import pre_delete, post_save
-from comments.listeners import incr_comments_count, decr_comments_count
+from django.db.models.signals import pre_delete, post_delete, post_save
+from comments.listeners import (
+    incr_comments_count,
+    decr_comments_count,
+    push_comment_to_cache,
+    remove_comment_from_cache,
+)
 
 
 class Comment(models.Model):
@@ -17,6 +22,9 @@ class Comment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     # Add this field to achieve denormalization of likes count
     likes_count = models.IntegerField(default=0, null=True)
+    # Generation of the last counter deltas flushed to the row in write-behind mode,
+    # see RedisHelper.flush_count_deltas
+    likes_count_generation = models.BigIntegerField(default=0)
 
     class Meta:
         index_together = (('tweet', 'created_at'),)
@@ -39,8 +47,13 @@ class Comment(models.Model):
 
     @property
     def cached_user(self):
-        return MemcachedHelper.get_instance_via_cache(model_class=User, obj_id=self.user.id)
+        # Set by CommentService.hydrate_comments for a whole page of comments
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
+        return MemcachedHelper.get_instance_via_cache(model_class=User, obj_id=self.user_id)
 
 
 post_save.connect(incr_comments_count, sender=Comment)
 pre_delete.connect(decr_comments_count, sender=Comment)
+post_save.connect(push_comment_to_cache, sender=Comment)
+post_delete.connect(remove_comment_from_cache, sender=Comment)
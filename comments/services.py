@@ -0,0 +1,63 @@
+from accounts.services import UserService
+from comments.models import Comment
+from likes.services import LikeServices
+from twitter.cache import TWEET_COMMENTS_PATTERN
+from utils.redis_helper import RedisHelper
+from utils.redis_serializers import DjangoModelSortedSetSerializer
+
+
+class CommentService(object):
+
+    @classmethod
+    def get_tweet_comments_queryset(cls, tweet_id):
+        return Comment.objects.filter(tweet_id=tweet_id).order_by('-created_at', '-id')
+
+    @classmethod
+    def get_cached_comments_range(cls, tweet_id, below=None, above=None, count=None):
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=tweet_id)
+        return RedisHelper.load_sorted_objects_range(
+            key,
+            cls.get_tweet_comments_queryset(tweet_id),
+            DjangoModelSortedSetSerializer,
+            below=below,
+            above=above,
+            count=count,
+        )
+
+    @classmethod
+    def push_comment_to_cache(cls, comment):
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=comment.tweet_id)
+        queryset = cls.get_tweet_comments_queryset(comment.tweet_id)
+        RedisHelper.push_single_sorted_object(key, comment, queryset, DjangoModelSortedSetSerializer)
+
+    @classmethod
+    def update_comment_in_cache(cls, comment):
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=comment.tweet_id)
+        RedisHelper.update_sorted_object(key, comment, DjangoModelSortedSetSerializer)
+
+    @classmethod
+    def remove_comment_from_cache(cls, comment):
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=comment.tweet_id)
+        RedisHelper.remove_sorted_object(key, comment, DjangoModelSortedSetSerializer)
+
+    @classmethod
+    def hydrate_comments(cls, comments, user):
+        # Batch load what CommentSerializer needs for a list of comments. User cards are
+        # attached to the comments, the other fields are returned by comment id
+        user_cards = UserService.get_user_cards(set(
+            comment.user_id for comment in comments if comment.user_id is not None
+        ))
+        for comment in comments:
+            if comment.user_id in user_cards:
+                comment._cached_user = user_cards[comment.user_id]
+
+        comment_ids = [comment.id for comment in comments]
+        likes_counts = RedisHelper.get_counts(comments, 'likes_count')
+        liked_comment_ids = LikeServices.get_liked_object_ids(user, Comment, comment_ids)
+        return {
+            comment.id: {
+                'like_count': likes_count,
+                'has_liked': comment.id in liked_comment_ids,
+            }
+            for comment, likes_count in zip(comments, likes_counts)
+        }
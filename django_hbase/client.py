@@ -1,14 +1,73 @@
+from contextlib import contextmanager
 from django.conf import settings
+from thriftpy2.transport import TTransportException
 import happybase
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 
 class HbaseClient:
 
-    conn = None
+    # Errors of the Thrift socket, the pool replaces the connection they happen on
+    TRANSPORT_ERRORS = (TTransportException, socket.error)
+
+    pool = None
+    lock = threading.Lock()
+
+    @classmethod
+    def get_pool(cls):
+        if cls.pool is not None:
+            return cls.pool
+        with cls.lock:
+            if cls.pool is None:
+                cls.pool = happybase.ConnectionPool(
+                    size=settings.HBASE_POOL_SIZE,
+                    host=settings.HBASE_HOST,
+                    port=settings.HBASE_PORT,
+                    timeout=settings.HBASE_SOCKET_TIMEOUT,
+                )
+        return cls.pool
+
+    @classmethod
+    @contextmanager
+    def connection(cls):
+        # Borrow a connection for the duration of the block, nested borrows in the same
+        # thread share it. Waits HBASE_POOL_TIMEOUT seconds at most for a free connection
+        with cls.get_pool().connection(timeout=settings.HBASE_POOL_TIMEOUT) as conn:
+            yield conn
+
+    @classmethod
+    def wait_before_retry(cls, attempt):
+        # Exponential backoff, False once the retries are used up
+        if attempt >= settings.HBASE_RETRIES:
+            return False
+        time.sleep(settings.HBASE_RETRY_BACKOFF * 2 ** attempt)
+        return True
+
+    @classmethod
+    def record_latency(cls, operation, seconds):
+        if seconds >= settings.HBASE_SLOW_CALL_THRESHOLD:
+            logger.warning('Slow HBase call %s took %.1f ms', operation, seconds * 1000)
+        else:
+            logger.debug('HBase call %s took %.1f ms', operation, seconds * 1000)
 
     @classmethod
-    def get_connection(cls):
-        if cls.conn:
-            return cls.conn
-        cls.conn = happybase.Connection(settings.HBASE_HOST)
-        return cls.conn
+    def execute(cls, operation, func):
+        # Call func(), which borrows its own connection, retrying it on transport errors
+        # with a fresh connection. Every attempt is timed
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                return func()
+            except cls.TRANSPORT_ERRORS as e:
+                logger.warning('HBase call %s failed on attempt %d: %r', operation, attempt + 1, e)
+                if not cls.wait_before_retry(attempt):
+                    raise
+                attempt += 1
+            finally:
+                cls.record_latency(operation, time.perf_counter() - start)
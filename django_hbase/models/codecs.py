@@ -0,0 +1,112 @@
+import struct
+from django_hbase.models.exceptions import BadRowKeyError
+from django_hbase.models.fields import IntegerField, TimestampField
+
+# Bits of every byte value in reverse order
+BIT_REVERSED_BYTES = bytes(int('{:08b}'.format(value)[::-1], 2) for value in range(256))
+
+
+class TextRowKeyCodec:
+    """
+    Row key fields serialized by the fields themselves and joined by ':'
+    {key1: val1} => b"val1"
+    {key1: val1, key2: val2} => b"val1:val2"
+    """
+    separator = ':'
+
+    def __init__(self, row_key_fields, salt_buckets=None):
+        if salt_buckets:
+            raise ValueError('Salted row keys require the binary row key codec')
+        self.encoders = tuple((key, field.serialize) for key, field in row_key_fields)
+        self.decoders = tuple((key, field.deserialize) for key, field in row_key_fields)
+
+    def encode(self, data, is_prefix=False):
+        values = []
+        for key, serialize in self.encoders:
+            val = data.get(key)
+            if val is None:
+                if not is_prefix:
+                    raise BadRowKeyError(f"{key} is missing in row key")
+                break
+            val = serialize(val)
+            if self.separator in val:
+                raise BadRowKeyError(f"{key} should not contain ':' in value: {val}")
+            values.append(val)
+        return bytes(self.separator.join(values), encoding='utf-8')
+
+    def decode(self, row_key):
+        if isinstance(row_key, bytes):
+            row_key = row_key.decode('utf-8')
+        values = row_key.split(self.separator)
+        return {
+            key: deserialize(value)
+            for (key, deserialize), value in zip(self.decoders, values)
+        }
+
+
+class BinaryRowKeyCodec:
+    """
+    Row key fields packed as big-endian 8 bytes integers without separators, so keys sort
+    like the values they hold and prefix scans keep working. Integers are offset by 2^63
+    to keep negative values in order. Timestamps are integers in microseconds.
+    Fields with reverse=True have their bits reversed, which spreads sequential values over
+    regions at the cost of their order. With salt_buckets, keys start with one salt byte,
+    the value of the first field modulo salt_buckets, which is then required by prefix scans
+    """
+    offset = 1 << 63
+
+    def __init__(self, row_key_fields, salt_buckets=None):
+        for key, field in row_key_fields:
+            if not isinstance(field, (IntegerField, TimestampField)):
+                raise TypeError(f"{key} cannot be packed in a binary row key")
+        self.fields = tuple((key, field.reverse) for key, field in row_key_fields)
+        # One struct per prefix length
+        self.structs = tuple(struct.Struct('>' + 'Q' * count) for count in range(len(self.fields) + 1))
+        if salt_buckets is not None and not 0 < salt_buckets <= 256:
+            raise ValueError('salt_buckets must be between 1 and 256')
+        self.salt_buckets = salt_buckets
+
+    @classmethod
+    def reverse_bits(cls, value):
+        return int.from_bytes(value.to_bytes(8, 'little').translate(BIT_REVERSED_BYTES), 'big')
+
+    def encode(self, data, is_prefix=False):
+        values = []
+        salt = None
+        for key, reverse in self.fields:
+            val = data.get(key)
+            if val is None:
+                if not is_prefix:
+                    raise BadRowKeyError(f"{key} is missing in row key")
+                break
+            # Taken before the offset and the bit reversal, whose low bits barely vary
+            if salt is None and self.salt_buckets:
+                salt = int(val) % self.salt_buckets
+            val = int(val) + self.offset
+            if reverse:
+                val = self.reverse_bits(val)
+            values.append(val)
+        row_key = self.structs[len(values)].pack(*values)
+        if not self.salt_buckets:
+            return row_key
+        if not values:
+            raise BadRowKeyError(f"{self.fields[0][0]} is required by salted row keys")
+        return salt.to_bytes(1, 'big') + row_key
+
+    def decode(self, row_key):
+        if self.salt_buckets:
+            row_key = row_key[1:]
+        count = min(len(row_key) // 8, len(self.fields))
+        values = self.structs[count].unpack(row_key[:count * 8])
+        data = {}
+        for (key, reverse), val in zip(self.fields, values):
+            if reverse:
+                val = self.reverse_bits(val)
+            data[key] = val - self.offset
+        return data
+
+
+ROW_KEY_CODECS = {
+    'text': TextRowKeyCodec,
+    'binary': BinaryRowKeyCodec,
+}
@@ -0,0 +1,6 @@
+class BadRowKeyError(Exception):
+    pass
+
+
+class EmptyColumnError(Exception):
+    pass
@@ -5,6 +5,18 @@ class HbaseField:
         self.reverse = reverse
         self.column_family = column_family
 
+    def serialize(self, value):
+        value = str(value)
+        if self.reverse:
+            value = value[::-1]
+        return value
+
+    def deserialize(self, value):
+        # Values are read as bytes from row data and as str from row keys
+        if self.reverse:
+            value = value[::-1]
+        return value
+
 
 class IntegerField(HbaseField):
     field_type = 'int'
@@ -12,9 +24,22 @@ class IntegerField(HbaseField):
     def __init__(self, *args, **kwargs):
         super(IntegerField, self).__init__(*args, **kwargs)
 
+    def serialize(self, value):
+        # Make integer contain 16 digit by filling empty digit with 0s
+        value = str(value).rjust(16, '0')
+        if self.reverse:
+            value = value[::-1]
+        return value
+
+    def deserialize(self, value):
+        return int(super(IntegerField, self).deserialize(value))
+
 
 class TimestampField(HbaseField):
     field_type = 'timestamp'
 
     def __init__(self, *args, auto_now_add=False, **kwargs):
         super(TimestampField, self).__init__(*args, **kwargs)
+
+    def deserialize(self, value):
+        return int(super(TimestampField, self).deserialize(value))
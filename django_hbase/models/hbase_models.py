@@ -1,35 +1,66 @@
-from django_hbase.models import HbaseField, TimestampField, IntegerField
+from contextlib import contextmanager
+from django_hbase.models import HbaseField
+from django_hbase.models.codecs import ROW_KEY_CODECS
+from django_hbase.models.exceptions import BadRowKeyError, EmptyColumnError
 from django_hbase.client import HbaseClient
 from django.conf import settings
+from happybase.util import bytes_increment
 
 
-class BadRowKeyError(Exception):
-    pass
+class HBaseModelMeta(type):
+    # Field metadata is compiled once when a model class is created, so that encoding and
+    # decoding rows only walks these tuples instead of introspecting the class every time
+    def __new__(mcs, name, bases, attrs):
+        cls = super(HBaseModelMeta, mcs).__new__(mcs, name, bases, attrs)
 
+        field_hash = {}
+        for base in reversed(cls.__mro__[1:]):
+            field_hash.update(getattr(base, '_field_hash', {}))
+        for key, value in attrs.items():
+            if isinstance(value, HbaseField):
+                field_hash[key] = value
+        cls._field_hash = field_hash
+
+        # Row key fields are ordered by Meta.row_key, or by definition when it is not set
+        row_key = cls.Meta.row_key or tuple(
+            key for key, field in field_hash.items() if not field.column_family
+        )
+        cls._row_key_fields = tuple((key, field_hash[key]) for key in row_key)
+        # Meta.row_key_codec is 'text' by default, see django_hbase.models.codecs
+        row_key_codec = ROW_KEY_CODECS[getattr(cls.Meta, 'row_key_codec', 'text')]
+        cls._row_key_codec = row_key_codec(
+            cls._row_key_fields,
+            salt_buckets=getattr(cls.Meta, 'row_key_salt_buckets', None),
+        )
 
-class EmptyColumnError(Exception):
-    pass
+        cls._column_fields = tuple(
+            (key, field) for key, field in field_hash.items() if field.column_family
+        )
+        cls._column_encoders = tuple(
+            (key, '{}:{}'.format(field.column_family, key), field.serialize)
+            for key, field in cls._column_fields
+        )
+        # Column keys are read as bytes from row data
+        cls._column_decoders = {
+            '{}:{}'.format(field.column_family, key).encode('utf-8'): (key, field.deserialize)
+            for key, field in cls._column_fields
+        }
+        return cls
 
 
-class HBaseModel:
+class HBaseModel(metaclass=HBaseModelMeta):
 
     class Meta:
         table_name = None
         row_key = None
 
     def __init__(self, **kwargs):
-        for key, field in self.get_field_hash().items():
-            value = kwargs.get(key)
-            setattr(self, key, value)
+        for key in self._field_hash:
+            setattr(self, key, kwargs.get(key))
 
     @classmethod
     def get_field_hash(cls):
-        field_hash = {}
-        for field_key in cls.__dict__:
-            field_obj = getattr(cls, field_key)
-            if isinstance(field_obj, HbaseField):
-                field_hash[field_key] = field_obj
-        return field_hash
+        return cls._field_hash
 
     @classmethod
     def get_table_name(cls):
@@ -40,33 +71,42 @@ class HBaseModel:
         return cls.Meta.table_name
 
     @classmethod
+    @contextmanager
     def get_table(cls):
-        conn = HbaseClient.get_connection()
-        return conn.table(cls.get_table_name())
+        # The table can only be used in the block, its connection goes back to the pool after
+        with HbaseClient.connection() as conn:
+            yield conn.table(cls.get_table_name())
+
+    @classmethod
+    def execute(cls, operation, func):
+        # Call func(table), retried with a fresh connection when the Thrift socket breaks
+        def call():
+            with cls.get_table() as table:
+                return func(table)
+        return HbaseClient.execute('{}.{}'.format(cls.get_table_name(), operation), call)
 
     @classmethod
     def drop_table(cls):
         if not settings.TESTING:
             raise Exception("You are not allowed to drop tables in Prod")
-        conn = HbaseClient.get_connection()
-        conn.delete_table(cls.get_table_name(), True)
+        with HbaseClient.connection() as conn:
+            conn.delete_table(cls.get_table_name(), True)
 
     @classmethod
     def create_table(cls):
         if not settings.TESTING:
             raise Exception("You are not allowed to create tables in Prod")
-        conn = HbaseClient.get_connection()
-        # Get all existing tables
-        tables = [table.decode('utf-8') for table in conn.tables()]
-        if cls.get_table_name() in tables:
-            return
-        # Create table when table not exist
-        column_families = {
-            field.column_family: dict()
-            for key, field in cls.get_field_hash().items()
-            if field.column_family is not None
-        }
-        conn.create_table(cls.get_table_name(), column_families)
+        with HbaseClient.connection() as conn:
+            # Get all existing tables
+            tables = [table.decode('utf-8') for table in conn.tables()]
+            if cls.get_table_name() in tables:
+                return
+            # Create table when table not exist
+            column_families = {
+                field.column_family: dict()
+                for key, field in cls._column_fields
+            }
+            conn.create_table(cls.get_table_name(), column_families)
 
     @property
     def row_key(self):
@@ -77,58 +117,33 @@ class HBaseModel:
         if not row_data:
             return None
         data = cls.deserialize_row_key(row_key)
+        column_decoders = cls._column_decoders
         for column_key, column_value in row_data.items():
-            # Change bytes to string
-            column_key = column_key.decode('utf-8')
-            # Remove column family
-            key = column_key[column_key.find(':') + 1:]
-            field = cls.get_field_hash().get(key)
-            data[key] = cls.deserialize_field(field, column_value)
+            # Columns which are not fields of the model, e.g. dropped ones, are skipped
+            decoder = column_decoders.get(column_key)
+            if decoder is None:
+                continue
+            key, deserialize = decoder
+            data[key] = deserialize(column_value)
         return cls(**data)
 
     @classmethod
     def serialize_field(cls, field, value):
-        value = str(value)
-        if isinstance(field, IntegerField):
-            # Make integer contain 16 digit by filling empty digit with 0s
-            value = str(value)
-            while len(value) < 16:
-                value = '0' + value
-        if field.reverse:
-            value = value[::-1]
-        return value
+        return field.serialize(value)
 
     @classmethod
     def deserialize_field(cls, field, value):
-        if field.reverse:
-            value = value[::-1]
-        if isinstance(field, IntegerField) or isinstance(field, TimestampField):
-            return int(value)
-        return value
+        return field.deserialize(value)
 
     @classmethod
     def serialize_row_key(cls, data, is_prefix=False):
         """
-        serialize dict to bytes (not str)
+        serialize dict to bytes (not str) with the row key codec of the model
         {key1: val1} => b"val1"
         {key1: val1, key2: val2} => b"val1:val2"
         {key1: val1, key2: val2, key3: val3} => b"val1:val2:val3"
         """
-        field_hash = cls.get_field_hash()
-        values = []
-        for key, field in field_hash.items():
-            if field.column_family:
-                continue
-            val = data.get(key)
-            if val is None:
-                if not is_prefix:
-                    raise BadRowKeyError(f"{key} is missing in row key")
-                break
-            val = cls.serialize_field(field, val)
-            if ':' in val:
-                raise BadRowKeyError(f"{key} should not contain ':' in value: {val}")
-            values.append(val)
-        return bytes(":".join(values), encoding='utf-8')
+        return cls._row_key_codec.encode(data, is_prefix=is_prefix)
 
     @classmethod
     def serialize_row_key_from_tuple(cls, row_key_tuple):
@@ -140,22 +155,90 @@ class HBaseModel:
         return cls.serialize_row_key(data, is_prefix=True)
 
     @classmethod
-    def filter(cls, start=None, stop=None, prefix=None, limit=None, reverse=False):
+    def get_column_keys(cls, keys):
+        # Field names to the column keys scans are projected on
+        field_hash = cls._field_hash
+        column_keys = []
+        for key in keys:
+            field = field_hash.get(key)
+            if field is None or not field.column_family:
+                raise ValueError(f"{key} is not a column of {cls.__name__}")
+            column_keys.append("{}:{}".format(field.column_family, key))
+        return column_keys
+
+    @classmethod
+    def scan(
+        cls,
+        start=None,
+        stop=None,
+        prefix=None,
+        limit=None,
+        reverse=False,
+        columns=None,
+        filter=None,
+        batch_size=1000,
+        scan_batching=None,
+    ):
+        """
+        Iterate over instances in row key order, rows are fetched batch_size at a time,
+        so memory stays constant however many rows are scanned. Every batch is read by its
+        own scanner with a connection borrowed for that batch only, so a partly consumed
+        iteration holds no connection. Batches are retried on transport errors.
+        columns: field names to read, the other columns are left None
+        filter: server side filter string, e.g. "KeyOnlyFilter()"
+        scan_batching: max number of columns returned per row in one batch
+        """
         # Serialize tuple to str(bytes)
         row_start = cls.serialize_row_key_from_tuple(start)
         row_stop = cls.serialize_row_key_from_tuple(stop)
         row_prefix = cls.serialize_row_key_from_tuple(prefix)
+        # Batches resume from a row key, so the prefix is turned into a range
+        if row_prefix is not None:
+            row_start, row_stop = row_prefix, bytes_increment(row_prefix)
+            if reverse:
+                row_start, row_stop = row_stop, row_start
 
-        # Scan table
-        table = cls.get_table()
-        rows = table.scan(row_start, row_stop, row_prefix, limit=limit, reverse=reverse)
+        column_keys = None if columns is None else cls.get_column_keys(columns)
 
-        # Deserialize to instance list
-        instances = []
-        for row_key, row_data in rows:
-            instance = cls.init_from_row(row_key, row_data)
-            instances.append(instance)
-        return instances
+        def fetch(batch_start, batch_limit):
+            return lambda table: list(table.scan(
+                batch_start,
+                row_stop,
+                columns=column_keys,
+                filter=filter,
+                limit=batch_limit,
+                reverse=reverse,
+                batch_size=batch_limit,
+                scan_batching=scan_batching,
+            ))
+
+        # The next batch starts at the last row key returned, skipping the results of that
+        # row which were returned already. There can be several with scan_batching
+        returned = 0
+        last_key, last_key_returned = row_start, 0
+        while limit is None or returned < limit:
+            batch_limit = batch_size if limit is None else min(batch_size, limit - returned)
+            rows = cls.execute('scan', fetch(last_key, batch_limit + last_key_returned))
+            has_more = len(rows) == batch_limit + last_key_returned
+            resumed_key, skipped = last_key, last_key_returned
+            for row_key, row_data in rows:
+                if skipped and row_key == resumed_key:
+                    skipped -= 1
+                    continue
+                skipped = 0
+                if row_key == last_key:
+                    last_key_returned += 1
+                else:
+                    last_key, last_key_returned = row_key, 1
+                returned += 1
+                yield cls.init_from_row(row_key, row_data)
+            if not has_more:
+                return
+
+    @classmethod
+    def filter(cls, start=None, stop=None, prefix=None, limit=None, reverse=False, **kwargs):
+        # Deserialize to instance list, see scan for the other arguments
+        return list(cls.scan(start, stop, prefix, limit=limit, reverse=reverse, **kwargs))
 
     @classmethod
     def deserialize_row_key(cls, row_key):
@@ -164,47 +247,87 @@ class HBaseModel:
          "val1:val2" => {'key1': val1, 'key2': val2, 'key3': None}
          "val1:val2:val3" => {'key1': val1, 'key2': val2, 'key3': val3}
          """
-        data = {}
-        if isinstance(row_key, bytes):
-            row_key = row_key.decode('utf-8')
-        row_key = row_key.split(":")
-
-        for i, key in enumerate(cls.Meta.row_key):
-            if len(row_key) == 0:
-                break
-            field = cls.get_field_hash().get(key)
-            data[key] = cls.deserialize_field(field, row_key[i])
-        return data
+        return cls._row_key_codec.decode(row_key)
 
     @classmethod
     def serialize_row_data(cls, data):
         row_data = {}
-        field_hash = cls.get_field_hash()
-
-        for key, field in field_hash.items():
-            if not field.column_family:
-                continue
-            column_key = "{}:{}".format(field.column_family, key)
+        for key, column_key, serialize in cls._column_encoders:
             column_val = data.get(key)
             if column_val is None:
                 continue
-            row_data[column_key] = cls.serialize_field(field, column_val)
+            row_data[column_key] = serialize(column_val)
         return row_data
 
     def save(self):
         row_data = self.serialize_row_data(self.__dict__)
         if len(row_data) == 0:
             raise EmptyColumnError()
-        table = self.get_table()
-        table.put(self.row_key, row_data)
+        row_key = self.row_key
+        self.execute('put', lambda table: table.put(row_key, row_data))
 
     @classmethod
     def get(cls, **kwargs):
         row_key = cls.serialize_row_key(kwargs)
-        table = cls.get_table()
-        row_data = table.row(row_key)
+        row_data = cls.execute('row', lambda table: table.row(row_key))
         return cls.init_from_row(row_key, row_data)
 
+    @classmethod
+    def get_many(cls, keys):
+        """
+        Read rows by a list of row key dicts in one round trip, instances are returned in
+        the order of keys, None for the rows which do not exist
+        """
+        row_keys = [cls.serialize_row_key(key) for key in keys]
+        if not row_keys:
+            return []
+        row_data_by_key = dict(cls.execute('rows', lambda table: table.rows(row_keys)))
+        return [
+            cls.init_from_row(row_key, row_data_by_key.get(row_key))
+            for row_key in row_keys
+        ]
+
+    @classmethod
+    def bulk_create(cls, instances, batch_size=1000):
+        # Instances are validated before any of them is written, puts are then sent
+        # batch_size mutations per round trip
+        rows = []
+        for instance in instances:
+            row_data = cls.serialize_row_data(instance.__dict__)
+            if len(row_data) == 0:
+                raise EmptyColumnError()
+            rows.append((instance.row_key, row_data))
+
+        def put_rows(table):
+            with table.batch(batch_size=batch_size) as batch:
+                for row_key, row_data in rows:
+                    batch.put(row_key, row_data)
+
+        # Puts are idempotent, resending the batches after a transport error is safe
+        cls.execute('batch', put_rows)
+        return instances
+
+    @classmethod
+    def migrate_rows_from(cls, source_model_class, batch_size=1000):
+        """
+        Copy every row of source_model_class to the table of this model, e.g. to rewrite a
+        table with another row key codec into a new table. The fields of this model are
+        read from the source instances. Rows are streamed and written batch_size at a time
+        """
+        keys = list(cls._field_hash)
+        migrated = 0
+        instances = []
+        for source_instance in source_model_class.scan(batch_size=batch_size):
+            instances.append(cls(**{key: getattr(source_instance, key, None) for key in keys}))
+            if len(instances) >= batch_size:
+                cls.bulk_create(instances, batch_size=batch_size)
+                migrated += len(instances)
+                instances = []
+        if instances:
+            cls.bulk_create(instances, batch_size=batch_size)
+            migrated += len(instances)
+        return migrated
+
     @classmethod
     def create(cls, **kwargs):
         instance = cls(**kwargs)
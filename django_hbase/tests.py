@@ -0,0 +1,167 @@
+# happybase loads its Thrift IDL as the Hbase_thrift module, so it is imported first
+import happybase  # noqa: F401
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.test import override_settings
+from django_hbase.client import HbaseClient
+from friendships.hbase_models import HBaseFollowing
+from Hbase_thrift import Hbase, TCell, TRowResult
+from testing.testcases import TestCase
+from thriftpy2.protocol import TBinaryProtocolFactory
+from thriftpy2.server import TThreadedServer
+from thriftpy2.thrift import TProcessor
+from thriftpy2.transport import TBufferedTransportFactory, TServerSocket, TTransportException
+
+
+class StubHbaseHandler:
+    # Serves the rows of a single table, sorted by row key, to happybase
+
+    def __init__(self, rows):
+        self.rows = sorted(rows)
+        self.scanners = {}
+
+    def getRowWithColumns(self, tableName, row, columns, attributes):
+        return [self.to_result(key, data) for key, data in self.rows if key == row]
+
+    def scannerOpenWithScan(self, tableName, scan, attributes):
+        if scan.reversed:
+            rows = [
+                (key, data) for key, data in reversed(self.rows)
+                if (not scan.startRow or key <= scan.startRow) and (scan.stopRow is None or key > scan.stopRow)
+            ]
+        else:
+            rows = [
+                (key, data) for key, data in self.rows
+                if key >= (scan.startRow or b'') and (scan.stopRow is None or key < scan.stopRow)
+            ]
+        scanner_id = len(self.scanners)
+        self.scanners[scanner_id] = [self.to_result(key, data) for key, data in rows]
+        return scanner_id
+
+    def scannerGetList(self, id, nbRows):
+        results = self.scanners[id]
+        self.scanners[id] = results[nbRows:]
+        return results[:nbRows]
+
+    def scannerClose(self, id):
+        self.scanners.pop(id, None)
+
+    def to_result(self, row_key, row_data):
+        columns = {key: TCell(value=value, timestamp=0) for key, value in row_data.items()}
+        return TRowResult(row=row_key, columns=columns)
+
+
+class StubHbaseServer(TThreadedServer):
+    # Thrift server on a free local port which closes its sockets on demand, like an HBase
+    # Thrift server being restarted
+
+    def __init__(self, rows):
+        super().__init__(
+            TProcessor(Hbase, StubHbaseHandler(rows)),
+            TServerSocket(host='127.0.0.1', port=0),
+            iprot_factory=TBinaryProtocolFactory(),
+            itrans_factory=TBufferedTransportFactory(),
+            daemon=True,
+        )
+        self.trans.listen()
+        self.port = self.trans.sock.getsockname()[1]
+        self.sockets = []
+        # Number of the next connections closed as soon as they are accepted
+        self.connections_to_close = 0
+        self.closed_connections = 0
+
+    def serve(self):
+        while not self.closed:
+            try:
+                client = self.trans.accept()
+            except (AssertionError, OSError):
+                return
+            if self.connections_to_close:
+                self.connections_to_close -= 1
+                self.closed_connections += 1
+                client.close()
+                continue
+            self.sockets.append(client.sock)
+            threading.Thread(target=self.handle, args=(client,), daemon=True).start()
+
+    def close_connections(self):
+        # Established connections break on their next call
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.sockets = []
+
+    def close(self):
+        super().close()
+        self.close_connections()
+        self.trans.close()
+
+
+class HBaseTransportTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.timestamps = [int(time.time() * 1000000) + i for i in range(3)]
+        rows = []
+        for to_user_id, timestamp in enumerate(self.timestamps):
+            row_key = HBaseFollowing.serialize_row_key({'from_user_id': 1, 'created_at': timestamp})
+            row_data = HBaseFollowing.serialize_row_data({'to_user_id': to_user_id})
+            rows.append((row_key, {key.encode('utf-8'): value.encode('utf-8') for key, value in row_data.items()}))
+        self.server = StubHbaseServer(rows)
+        threading.Thread(target=self.server.serve, daemon=True).start()
+        self.addCleanup(self.server.close)
+
+        # A pool of one connection to the stub server
+        settings_override = override_settings(
+            HBASE_HOST='127.0.0.1',
+            HBASE_PORT=self.server.port,
+            HBASE_POOL_SIZE=1,
+            HBASE_RETRIES=2,
+            HBASE_RETRY_BACKOFF=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        HbaseClient.pool = None
+        self.addCleanup(setattr, HbaseClient, 'pool', None)
+
+    def test_retry_transport_errors(self):
+        instance = HBaseFollowing.get(from_user_id=1, created_at=self.timestamps[0])
+        self.assertEqual(instance.to_user_id, 0)
+
+        # The socket is closed under the pooled connection, and the first reconnection is
+        # closed as well. The call is retried on a new connection each time
+        self.server.close_connections()
+        self.server.connections_to_close = 1
+        instance = HBaseFollowing.get(from_user_id=1, created_at=self.timestamps[1])
+        self.assertEqual(instance.to_user_id, 1)
+        self.assertEqual(self.server.closed_connections, 1)
+
+        # Errors are raised once the retries are used up
+        self.server.close_connections()
+        self.server.connections_to_close = 2
+        with self.assertRaises(TTransportException):
+            HBaseFollowing.get(from_user_id=1, created_at=self.timestamps[0])
+        self.assertEqual(self.server.closed_connections, 3)
+
+    def test_scan(self):
+        # Rows are scanned in row key order, reversed ids put the newest first
+        followings = HBaseFollowing.scan(prefix=(1, None, None), batch_size=1)
+        self.assertEqual(next(followings).to_user_id, 0)
+
+        # The connection is back in the pool between batches, another thread can borrow it
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            instance = executor.submit(HBaseFollowing.get, from_user_id=1, created_at=self.timestamps[2]).result()
+        self.assertEqual(instance.to_user_id, 2)
+
+        # A batch failing on a closed socket is retried, the scan goes on where it stopped
+        self.server.close_connections()
+        self.assertEqual([following.to_user_id for following in followings], [1, 2])
+
+        results = HBaseFollowing.scan(prefix=(1, None, None), batch_size=2, reverse=True)
+        self.assertEqual([following.to_user_id for following in results], [2, 1, 0])
+        results = HBaseFollowing.scan(prefix=(1, None, None), batch_size=2, limit=3)
+        self.assertEqual([following.to_user_id for following in results], [0, 1, 2])
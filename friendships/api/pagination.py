@@ -1,6 +1,16 @@
+from functools import partial
+from django.core.paginator import Paginator
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from collections import OrderedDict
+from utils.paginations import EndlessPagination
+
+
+class CountedPaginator(Paginator):
+    # The total is read from the denormalized counts instead of COUNT(*)
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super(CountedPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.__dict__['count'] = count
 
 
 class FriendshipPagination(PageNumberPagination):
@@ -13,7 +23,33 @@ class FriendshipPagination(PageNumberPagination):
     # The max page size that client can choose
     max_page_size = 20
 
+    def __init__(self):
+        super(FriendshipPagination, self).__init__()
+        self.total_results = None
+        self.endless_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None, total_results=None):
+        # Pages are numbered unless `cursor` is given, an empty one for the first page. Cursor
+        # pages are read on (created_at, id), which seeks the index instead of scanning OFFSET rows
+        self.total_results = total_results
+        if EndlessPagination.cursor_query_param in request.query_params:
+            self.endless_pagination = EndlessPagination()
+            self.endless_pagination.page_size = self.get_page_size(request)
+            return self.endless_pagination.paginate_queryset(queryset, request, view)
+
+        self.endless_pagination = None
+        if total_results is not None:
+            self.django_paginator_class = partial(CountedPaginator, count=total_results)
+        return super(FriendshipPagination, self).paginate_queryset(queryset, request, view)
+
     def get_paginated_response(self, data):
+        if self.endless_pagination is not None:
+            return Response(OrderedDict([
+                ('total_results', self.total_results),
+                ('has_next_page', self.endless_pagination.has_next_page),
+                ('next_cursor', self.endless_pagination.next_cursor),
+                ('results', data),
+            ]))
         return Response(OrderedDict([
             ('total_results', self.page.paginator.count),
             ('total_pages', self.page.paginator.num_pages),
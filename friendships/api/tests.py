@@ -1,5 +1,10 @@
 import time
+from contextlib import contextmanager
+from django.test import override_settings
 from rest_framework.test import APIClient
+from thriftpy2.transport import TTransportException
+from unittest import mock
+from django_hbase import models
 from django_hbase.models import EmptyColumnError, BadRowKeyError
 from friendships.api.pagination import FriendshipPagination
 from friendships.hbase_models import HBaseFollowing, HBaseFollower
@@ -157,6 +162,44 @@ class FriendshipAPITests(TestCase):
         for result in response.data['results']:
             self.assertEqual(result['has_followed'], True)
 
+    def test_followers_cursor_pagination(self):
+        page_size = FriendshipPagination.page_size
+        followers = []
+        for i in range(page_size + 2):
+            follower = self.create_user('zhekang_follower{}'.format(i))
+            Friendship.objects.create(from_user=follower, to_user=self.zhekang)
+            followers.append(follower)
+
+        # Pages are numbered by default
+        url = FOLLOWERS_API.format(self.zhekang.id)
+        response = self.anonymous_client.get(url)
+        self.assertEqual(response.data['page_number'], 1)
+        self.assertEqual(response.data['total_pages'], 2)
+        self.assertNotIn('next_cursor', response.data)
+
+        # Pages are read by cursor when cursor is given, total comes from the counts
+        response = self.anonymous_client.get(url, {'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_results'], page_size + 2)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [result['user']['id'] for result in response.data['results']],
+            [follower.id for follower in followers[::-1][:page_size]],
+        )
+
+        response = self.anonymous_client.get(url, {'cursor': response.data['next_cursor']})
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(response.data['next_cursor'], None)
+        self.assertEqual(
+            [result['user']['id'] for result in response.data['results']],
+            [follower.id for follower in followers[::-1][page_size:]],
+        )
+
+        # size applies to cursor pages as well
+        response = self.anonymous_client.get(FOLLOWINGS_API.format(followers[0].id), {'cursor': '', 'size': 1})
+        self.assertEqual(response.data['total_results'], 1)
+        self.assertEqual(response.data['results'][0]['user']['id'], self.zhekang.id)
+
     def _test_friendship_pagination(self, url, page_size, max_page_size):
         response = self.anonymous_client.get(url, {'page': 1})
         self.assertEqual(response.status_code, 200)
@@ -200,6 +243,85 @@ class HBaseTests(TestCase):
     def ts_now(self):
         return int(time.time() * 1000000)
 
+    def test_row_codecs(self):
+        # Fields are compiled once per model, row keys follow Meta.row_key
+        self.assertEqual(list(HBaseFollower.get_field_hash()), ['to_user_id', 'created_at', 'from_user_id'])
+        self.assertEqual([key for key, _ in HBaseFollower._row_key_fields], ['to_user_id', 'created_at'])
+
+        timestamp = self.ts_now
+        row_key = HBaseFollower.serialize_row_key({'to_user_id': 2, 'created_at': timestamp})
+        self.assertEqual(HBaseFollower.deserialize_row_key(row_key), {'to_user_id': 2, 'created_at': timestamp})
+
+        # Columns which are not fields are skipped
+        row_data = HBaseFollower.serialize_row_data({'from_user_id': 1})
+        row_data = {key.encode('utf-8'): value.encode('utf-8') for key, value in row_data.items()}
+        row_data[b'cf:dropped'] = b'1'
+        instance = HBaseFollower.init_from_row(row_key, row_data)
+        self.assertEqual(instance.from_user_id, 1)
+        self.assertEqual(instance.to_user_id, 2)
+        self.assertEqual(instance.created_at, timestamp)
+
+    def _binary_following_class(self, salt_buckets=None, reverse=False):
+        class BinaryHBaseFollowing(HBaseFollowing):
+            from_user_id = models.IntegerField(reverse=reverse)
+
+            class Meta:
+                table_name = 'twitter_followings_binary'
+                row_key = ('from_user_id', 'created_at')
+                row_key_codec = 'binary'
+                row_key_salt_buckets = salt_buckets
+        return BinaryHBaseFollowing
+
+    def test_binary_row_keys(self):
+        model_class = self._binary_following_class()
+        timestamp = self.ts_now
+        row_key = model_class.serialize_row_key({'from_user_id': 123, 'created_at': timestamp})
+        self.assertEqual(len(row_key), 16)
+        self.assertEqual(model_class.deserialize_row_key(row_key), {'from_user_id': 123, 'created_at': timestamp})
+
+        # Keys sort like the values, prefixes are the leading bytes of full keys
+        values = [(-5, 3), (0, 9), (1, 2), (1, 10), (255, 1), (256, 0), (2 ** 40, 7)]
+        row_keys = [
+            model_class.serialize_row_key({'from_user_id': from_user_id, 'created_at': created_at})
+            for from_user_id, created_at in values
+        ]
+        self.assertEqual(sorted(row_keys), row_keys)
+        prefix = model_class.serialize_row_key_from_tuple((1, None))
+        self.assertEqual([row_key.startswith(prefix) for row_key in row_keys], [False, False, True, True, False, False, False])
+
+        # Reversed bits spread sequential ids, salts take one leading byte
+        model_class = self._binary_following_class(salt_buckets=16, reverse=True)
+        row_key = model_class.serialize_row_key({'from_user_id': 123, 'created_at': timestamp})
+        self.assertEqual(len(row_key), 17)
+        self.assertEqual(model_class.deserialize_row_key(row_key), {'from_user_id': 123, 'created_at': timestamp})
+        self.assertEqual(row_key.startswith(model_class.serialize_row_key_from_tuple((123, None))), True)
+        with self.assertRaises(BadRowKeyError):
+            model_class.serialize_row_key_from_tuple((None, None))
+
+        # Sequential ids spread evenly over the salt buckets
+        for reverse in (True, False):
+            model_class = self._binary_following_class(salt_buckets=16, reverse=reverse)
+            salts = [
+                model_class.serialize_row_key({'from_user_id': from_user_id, 'created_at': timestamp})[0]
+                for from_user_id in range(1, 65)
+            ]
+            self.assertEqual(sorted(set(salts)), list(range(16)))
+            self.assertEqual(max(salts.count(salt) for salt in range(16)), 4)
+
+    def test_migrate_rows_from(self):
+        model_class = self._binary_following_class()
+        model_class.create_table()
+        try:
+            for to_user_id in range(2, 5):
+                HBaseFollowing.create(from_user_id=1, to_user_id=to_user_id, created_at=self.ts_now)
+            HBaseFollowing.create(from_user_id=2, to_user_id=1, created_at=self.ts_now)
+
+            self.assertEqual(model_class.migrate_rows_from(HBaseFollowing, batch_size=2), 4)
+            results = model_class.filter(prefix=(1, None))
+            self.assertEqual([following.to_user_id for following in results], [2, 3, 4])
+        finally:
+            model_class.drop_table()
+
     def test_save_and_get(self):
         timestamp = self.ts_now
         following = HBaseFollowing(from_user_id=123, to_user_id=34, created_at=timestamp)
@@ -300,3 +422,92 @@ class HBaseTests(TestCase):
         self.assertEqual(results[0].to_user_id, 3)
         self.assertEqual(results[1].to_user_id, 2)
 
+
+    def test_scan(self):
+        for to_user_id in range(2, 6):
+            HBaseFollowing.create(from_user_id=1, to_user_id=to_user_id, created_at=self.ts_now)
+        HBaseFollowing.create(from_user_id=2, to_user_id=1, created_at=self.ts_now)
+
+        # Rows are streamed instead of being returned as a list
+        followings = HBaseFollowing.scan(prefix=(1, None, None), batch_size=2)
+        self.assertEqual(isinstance(followings, list), False)
+        self.assertEqual([following.to_user_id for following in followings], [2, 3, 4, 5])
+
+        results = HBaseFollowing.scan(prefix=(1, None, None), limit=3, reverse=True)
+        self.assertEqual([following.to_user_id for following in results], [5, 4, 3])
+
+        # Only the projected columns are read
+        results = list(HBaseFollowing.scan(prefix=(2, None, None), columns=['to_user_id']))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].to_user_id, 1)
+        with self.assertRaises(ValueError):
+            list(HBaseFollowing.scan(prefix=(2, None, None), columns=['created_at']))
+
+    def test_bulk_create_and_get_many(self):
+        timestamp = self.ts_now
+        followers = [
+            HBaseFollower(to_user_id=1, from_user_id=from_user_id, created_at=timestamp + from_user_id)
+            for from_user_id in range(2, 6)
+        ]
+        HBaseFollower.bulk_create(followers, batch_size=3)
+        results = HBaseFollower.filter(prefix=(1, None, None))
+        self.assertEqual([follower.from_user_id for follower in results], [2, 3, 4, 5])
+
+        # Nothing is written when one of the instances has no column data
+        with self.assertRaises(EmptyColumnError):
+            HBaseFollower.bulk_create([
+                HBaseFollower(to_user_id=2, from_user_id=1, created_at=timestamp),
+                HBaseFollower(to_user_id=2, created_at=timestamp + 1),
+            ])
+        self.assertEqual(HBaseFollower.filter(prefix=(2, None, None)), [])
+
+        # Instances are returned in the order of keys, None for missing rows
+        results = HBaseFollower.get_many([
+            {'to_user_id': 1, 'created_at': timestamp + 4},
+            {'to_user_id': 1, 'created_at': timestamp},
+            {'to_user_id': 1, 'created_at': timestamp + 2},
+        ])
+        self.assertEqual(results[0].from_user_id, 4)
+        self.assertEqual(results[1], None)
+        self.assertEqual(results[2].from_user_id, 2)
+
+    def _flaky_get_table(self, model_class, failures):
+        # get_table whose first borrows fail like a broken Thrift socket
+        get_table = model_class.get_table
+        calls = []
+
+        @contextmanager
+        def flaky_get_table():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise TTransportException(message='Socket read 0 bytes')
+            with get_table() as table:
+                yield table
+        return flaky_get_table, calls
+
+    @override_settings(HBASE_RETRIES=2, HBASE_RETRY_BACKOFF=0)
+    def test_retry_transport_errors(self):
+        timestamp = self.ts_now
+        HBaseFollowing.create(from_user_id=1, to_user_id=2, created_at=timestamp)
+
+        # Transport errors are retried with a new connection, each attempt is timed
+        flaky_get_table, calls = self._flaky_get_table(HBaseFollowing, failures=2)
+        with mock.patch.object(HBaseFollowing, 'get_table', flaky_get_table), \
+                self.assertLogs('django_hbase.client', level='DEBUG') as logs:
+            instance = HBaseFollowing.get(from_user_id=1, created_at=timestamp)
+        self.assertEqual(instance.to_user_id, 2)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len([line for line in logs.output if 'row took' in line]), 3)
+
+        flaky_get_table, calls = self._flaky_get_table(HBaseFollowing, failures=1)
+        with mock.patch.object(HBaseFollowing, 'get_table', flaky_get_table):
+            results = list(HBaseFollowing.scan(prefix=(1, None, None)))
+        self.assertEqual([following.to_user_id for following in results], [2])
+        self.assertEqual(len(calls), 2)
+
+        # Errors are raised once the retries are used up
+        flaky_get_table, calls = self._flaky_get_table(HBaseFollowing, failures=3)
+        with mock.patch.object(HBaseFollowing, 'get_table', flaky_get_table):
+            with self.assertRaises(TTransportException):
+                HBaseFollowing.get(from_user_id=1, created_at=timestamp)
+        self.assertEqual(len(calls), 3)
@@ -12,6 +12,7 @@ from friendships.api.serializers import (
     FriendshipSerializerForCreate,
 )
 from friendships.models import Friendship
+from friendships.services import FriendshipServices
 
 
 class FriendshipViewSet(viewsets.GenericViewSet):
@@ -22,18 +23,28 @@ class FriendshipViewSet(viewsets.GenericViewSet):
     @action(methods=['GET'], detail=True, permission_classes=[AllowAny])
     @method_decorator(ratelimit(key='user_or_ip', rate='3/s', method='GET', block=True))
     def followers(self, request, pk):
-        self.get_object()
-        friendships = Friendship.objects.filter(to_user_id=pk).order_by('-created_at')
-        page = self.paginate_queryset(friendships)
+        user = self.get_object()
+        friendships = Friendship.objects.filter(to_user_id=user.id).order_by('-created_at', '-id')
+        page = self.paginator.paginate_queryset(
+            friendships,
+            request,
+            view=self,
+            total_results=FriendshipServices.get_followers_count(user.id),
+        )
         serializer = FollowerSerializer(instance=page, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
 
     @action(methods=['GET'], detail=True, permission_classes=[AllowAny])
     @method_decorator(ratelimit(key='user_or_ip', rate='3/s', method='GET', block=True))
     def followings(self, request, pk):
-        self.get_object()
-        friendships = Friendship.objects.filter(from_user_id=pk).order_by('-created_at')
-        page = self.paginate_queryset(friendships)
+        user = self.get_object()
+        friendships = Friendship.objects.filter(from_user_id=user.id).order_by('-created_at', '-id')
+        page = self.paginator.paginate_queryset(
+            friendships,
+            request,
+            view=self,
+            total_results=FriendshipServices.get_followings_count(user.id),
+        )
         serializer = FollowingSerializer(instance=page, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
 
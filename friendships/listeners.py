@@ -1,3 +1,18 @@
 def friendship_changed(sender, instance, **kwargs):
     from friendships.services import FriendshipServices
-    FriendshipServices.invalidate_following_cache(from_user_id=instance.from_user_id)
\ No newline at end of file
+    from newsfeeds.services import NewsFeedServices
+    # Connected to post_save and post_delete, only post_save passes created
+    created = kwargs.get('created')
+    if created is not False:
+        FriendshipServices.change_friendship_counts(
+            from_user_id=instance.from_user_id,
+            to_user_id=instance.to_user_id,
+            delta=1 if created else -1,
+        )
+    FriendshipServices.invalidate_following_cache(from_user_id=instance.from_user_id)
+    NewsFeedServices.invalidate_pull_mode_following_cache(user_id=instance.from_user_id)
+    FriendshipServices.invalidate_followers_count_cache(to_user_id=instance.to_user_id)
+    FriendshipServices.invalidate_followings_count_cache(from_user_id=instance.from_user_id)
+    # Read after the cached count is invalidated, so the changed count is seen
+    if created is not False:
+        NewsFeedServices.followers_count_changed(user_id=instance.to_user_id, delta=1 if created else -1)
@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from friendships.listeners import friendship_changed
-from django.db.models.signals import pre_delete, post_save
+from django.db.models.signals import post_delete, post_save
 from utils.memcached_helper import MemcachedHelper
 
 
@@ -38,5 +38,5 @@ class Friendship(models.Model):
         return MemcachedHelper.get_instance_via_cache(model_class=User, obj_id=self.from_user_id)
 
 
-pre_delete.connect(friendship_changed, sender=Friendship)
+post_delete.connect(friendship_changed, sender=Friendship)
 post_save.connect(friendship_changed, sender=Friendship)
\ No newline at end of file
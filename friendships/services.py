@@ -1,8 +1,10 @@
+from accounts.models import UserProfile
 from friendships.models import Friendship
 from django.conf import settings
 from django.core.cache import caches
 from django.contrib.auth.models import User
-from twitter.cache import FOLLOWINGS_PATTERN
+from django.db.models import F
+from twitter.cache import FOLLOWINGS_PATTERN, FOLLOWERS_COUNT_PATTERN, FOLLOWINGS_COUNT_PATTERN
 
 cache = caches['testing'] if settings.TESTING else caches['default']
 
@@ -10,14 +12,22 @@ cache = caches['testing'] if settings.TESTING else caches['default']
 class FriendshipServices(object):
 
     @classmethod
-    def get_all_follower_ids(cls, user_id):
-        friendships = Friendship.objects.filter(to_user_id=user_id)
-        follower_ids = [friendship.from_user_id for friendship in friendships]
-        # followers = User.objects.filter(id__in=follower_ids)
-
-        # friendships = Friendship.objects.filter(to_user=user).prefetch_related('from_user')
-        # followers = [friendship.from_user for friendship in friendships]
-        return follower_ids
+    def iter_follower_ids(cls, user_id, chunk_size=2000):
+        # Follower ids are read in chunks of friendships ordered by id, each chunk with its own
+        # query starting after the last id, so only one chunk is held in memory even when the
+        # DB driver buffers whole result sets
+        last_id = 0
+        while True:
+            rows = list(
+                Friendship.objects.filter(to_user_id=user_id, id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'from_user_id')[:chunk_size]
+            )
+            for _, from_user_id in rows:
+                yield from_user_id
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][0]
 
     # @classmethod
     # def has_followed(cls, from_user, to_user):
@@ -40,3 +50,78 @@ class FriendshipServices(object):
     def invalidate_following_cache(cls, from_user_id):
         key = FOLLOWINGS_PATTERN.format(user_id=from_user_id)
         cache.delete(key)
+
+    @classmethod
+    def _get_counts(cls, user_ids, pattern, attr):
+        # Read all counts with one get_many, and read the missed ones from profiles in one query.
+        # Users with friendships always have a profile, so users without one count 0
+        keys = {pattern.format(user_id=user_id): user_id for user_id in user_ids}
+        cached_counts = cache.get_many(keys.keys())
+        counts = {keys[key]: count for key, count in cached_counts.items()}
+
+        missed_user_ids = [user_id for user_id in user_ids if user_id not in counts]
+        if not missed_user_ids:
+            return counts
+        missed_counts = {user_id: 0 for user_id in missed_user_ids}
+        rows = UserProfile.objects.filter(user_id__in=missed_user_ids).values_list('user_id', attr)
+        for user_id, count in rows:
+            missed_counts[user_id] = count or 0
+        cache.set_many({
+            pattern.format(user_id=user_id): count
+            for user_id, count in missed_counts.items()
+        })
+        counts.update(missed_counts)
+        return counts
+
+    @classmethod
+    def get_followers_counts(cls, user_ids):
+        return cls._get_counts(user_ids, FOLLOWERS_COUNT_PATTERN, 'followers_count')
+
+    @classmethod
+    def get_followers_count(cls, user_id):
+        return cls.get_followers_counts([user_id])[user_id]
+
+    @classmethod
+    def get_followings_counts(cls, user_ids):
+        return cls._get_counts(user_ids, FOLLOWINGS_COUNT_PATTERN, 'followings_count')
+
+    @classmethod
+    def get_followings_count(cls, user_id):
+        return cls.get_followings_counts([user_id])[user_id]
+
+    @classmethod
+    def _change_count(cls, user_id, attr, delta):
+        if user_id is None:
+            return
+        if UserProfile.objects.filter(user_id=user_id).update(**{attr: F(attr) + delta}):
+            return
+        # Profiles are created lazily, a missing one starts from the friendships in DB,
+        # which already include the change
+        _, created = UserProfile.objects.get_or_create(user_id=user_id, defaults={
+            'followers_count': Friendship.objects.filter(to_user_id=user_id).count(),
+            'followings_count': Friendship.objects.filter(from_user_id=user_id).count(),
+        })
+        # The profile was created by another process in the meantime
+        if not created:
+            UserProfile.objects.filter(user_id=user_id).update(**{attr: F(attr) + delta})
+
+    @classmethod
+    def change_friendship_counts(cls, from_user_id, to_user_id, delta):
+        from accounts.services import UserService
+        cls._change_count(from_user_id, 'followings_count', delta)
+        cls._change_count(to_user_id, 'followers_count', delta)
+        # Updates skip post_save of the profiles, their cached copies are invalidated here.
+        # Cards do not hold the counts, so they and their versions are left alone
+        for user_id in (from_user_id, to_user_id):
+            if user_id is not None:
+                UserService.invalidate_cached_profile(user_id)
+
+    @classmethod
+    def invalidate_followers_count_cache(cls, to_user_id):
+        key = FOLLOWERS_COUNT_PATTERN.format(user_id=to_user_id)
+        cache.delete(key)
+
+    @classmethod
+    def invalidate_followings_count_cache(cls, from_user_id):
+        key = FOLLOWINGS_COUNT_PATTERN.format(user_id=from_user_id)
+        cache.delete(key)
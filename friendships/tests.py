@@ -1,3 +1,5 @@
+from accounts.models import UserProfile
+from accounts.services import UserService
 from testing.testcases import TestCase
 from friendships.models import Friendship
 from friendships.services import FriendshipServices
@@ -23,3 +25,57 @@ class FriendshipServiceTests(TestCase):
         Friendship.objects.filter(from_user=self.zhekang, to_user=user_1).delete()
         user_id_set = FriendshipServices.get_following_user_id_set(self.zhekang.id)
         self.assertEqual(user_id_set, {user_2.id, self.xiaohe.id})
+
+    def test_friendship_counts(self):
+        self.assertEqual(FriendshipServices.get_followers_count(self.xiaohe.id), 0)
+        self.assertEqual(FriendshipServices.get_followings_count(self.zhekang.id), 0)
+
+        # Counts are kept on profiles, users without a profile get one on their first friendship
+        self.assertEqual(UserProfile.objects.filter(user=self.xiaohe).exists(), False)
+        Friendship.objects.create(from_user=self.zhekang, to_user=self.xiaohe)
+        user_1 = self.create_user('user_1')
+        Friendship.objects.create(from_user=user_1, to_user=self.xiaohe)
+        self.assertEqual(UserProfile.objects.get(user=self.xiaohe).followers_count, 2)
+        self.assertEqual(FriendshipServices.get_followers_count(self.xiaohe.id), 2)
+        self.assertEqual(FriendshipServices.get_followings_count(self.zhekang.id), 1)
+        self.assertEqual(
+            FriendshipServices.get_followers_counts([self.xiaohe.id, self.zhekang.id]),
+            {self.xiaohe.id: 2, self.zhekang.id: 0},
+        )
+
+        # Unfollow one user
+        Friendship.objects.filter(from_user=self.zhekang, to_user=self.xiaohe).delete()
+        self.assertEqual(FriendshipServices.get_followers_count(self.xiaohe.id), 1)
+        self.assertEqual(FriendshipServices.get_followings_count(self.zhekang.id), 0)
+
+    def test_iter_follower_ids(self):
+        followers = [self.create_user('user_{}'.format(i)) for i in range(5)]
+        for follower in followers:
+            Friendship.objects.create(from_user=follower, to_user=self.xiaohe)
+        Friendship.objects.create(from_user=self.xiaohe, to_user=self.zhekang)
+
+        # Each chunk is read by its own query
+        with self.assertNumQueries(3):
+            follower_ids = list(FriendshipServices.iter_follower_ids(self.xiaohe.id, chunk_size=2))
+        self.assertEqual(follower_ids, [follower.id for follower in followers])
+        with self.assertNumQueries(2):
+            follower_ids = list(FriendshipServices.iter_follower_ids(self.xiaohe.id, chunk_size=5))
+        self.assertEqual(len(follower_ids), 5)
+
+    def test_profile_counts(self):
+        # Cached profiles are invalidated when their counts change, cards are not
+        profile = UserService.get_profile_via_cache(self.xiaohe.id)
+        self.assertEqual(profile.followers_count, 0)
+        versions = UserService.get_user_card_versions([self.xiaohe.id, self.zhekang.id])
+        Friendship.objects.create(from_user=self.zhekang, to_user=self.xiaohe)
+        self.assertEqual(UserService.get_user_card_versions([self.xiaohe.id, self.zhekang.id]), versions)
+        self.assertEqual(UserService.get_profile_via_cache(self.xiaohe.id).followers_count, 1)
+        self.assertEqual(UserService.get_profile_via_cache(self.zhekang.id).followings_count, 1)
+
+        # Saving a profile loaded before the change keeps the counts in DB
+        profile.nickname = 'xh'
+        profile.save()
+        profile = UserProfile.objects.get(user=self.xiaohe)
+        self.assertEqual(profile.nickname, 'xh')
+        self.assertEqual(profile.followers_count, 1)
+        self.assertEqual(UserService.get_profile_via_cache(self.xiaohe.id).nickname, 'xh')
@@ -1,4 +1,5 @@
 from accounts.api.serializers import UserSerializerForLike
+from django.db import models
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from likes.models import Like
@@ -6,6 +7,7 @@ from comments.models import Comment
 from tweets.models import Tweet
 from django.contrib.contenttypes.models import ContentType
 from inbox.services import NotificationService
+from likes.services import LikeServices
 
 CONTENT_TYPE_STR_TO_CLASS = {
     'comment': Comment,
@@ -13,12 +15,22 @@ CONTENT_TYPE_STR_TO_CLASS = {
 }
 
 
+class LikeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        likes = list(iterable)
+        LikeServices.hydrate_likes(likes)
+        return super(LikeListSerializer, self).to_representation(likes)
+
+
 class LikeSerializer(serializers.ModelSerializer):
     user = UserSerializerForLike(source='cached_user')
 
     class Meta:
         model = Like
         fields = ('user', 'created_at', )
+        list_serializer_class = LikeListSerializer
 
 
 class BaseLikeSerializerForCreateAndCancel(serializers.ModelSerializer):
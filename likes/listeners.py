@@ -4,19 +4,16 @@ from utils.redis_helper import RedisHelper
 def incr_likes_count(sender, instance, created, **kwargs):
     from tweets.models import Tweet
     from comments.models import Comment
-    from django.db.models import F
     if not created:
         return
     model_class = instance.content_type.model_class()
+    # The DB row is updated by RedisHelper, later by the flush task in write-behind mode.
+    # Only the id is needed to reach the counter, skip loading the target
     if model_class == Tweet:
-        Tweet.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') + 1)
-        tweet = instance.content_object
-        RedisHelper.incr_count(tweet, 'likes_count')
+        RedisHelper.incr_count(Tweet(id=instance.object_id), 'likes_count')
         return
     if model_class == Comment:
-        Comment.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') + 1)
-        comment = instance.content_object
-        RedisHelper.incr_count(comment, 'likes_count')
+        RedisHelper.incr_count(Comment(id=instance.object_id), 'likes_count')
         return
     return
 
@@ -24,17 +21,31 @@ def incr_likes_count(sender, instance, created, **kwargs):
 def decr_likes_count(sender, instance, **kwargs):
     from tweets.models import Tweet
     from comments.models import Comment
-    from django.db.models import F
 
     model_class = instance.content_type.model_class()
     if model_class == Tweet:
-        Tweet.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') - 1)
-        tweet = instance.content_object
-        RedisHelper.decr_count(tweet, 'likes_count')
+        RedisHelper.decr_count(Tweet(id=instance.object_id), 'likes_count')
         return
     if model_class == Comment:
-        Comment.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') - 1)
-        comment = instance.content_object
-        RedisHelper.decr_count(comment, 'likes_count')
+        RedisHelper.decr_count(Comment(id=instance.object_id), 'likes_count')
         return
     return
+
+
+def push_like_to_cache(sender, instance, created, **kwargs):
+    from tweets.models import Tweet
+    from likes.services import LikeServices
+
+    # Only the likes of tweets are cached, they are listed in tweet details
+    if not created or instance.content_type.model_class() != Tweet:
+        return
+    LikeServices.push_tweet_like_to_cache(instance)
+
+
+def remove_like_from_cache(sender, instance, **kwargs):
+    from tweets.models import Tweet
+    from likes.services import LikeServices
+
+    if instance.content_type.model_class() != Tweet:
+        return
+    LikeServices.remove_tweet_like_from_cache(instance)
@@ -2,8 +2,8 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.db.models.signals import pre_delete, post_save
-from likes.listeners import incr_likes_count, decr_likes_count
+from django.db.models.signals import pre_delete, post_delete, post_save
+from likes.listeners import incr_likes_count, decr_likes_count, push_like_to_cache, remove_like_from_cache
 from utils.memcached_helper import MemcachedHelper
 
 
@@ -25,8 +25,13 @@ class Like(models.Model):
 
     @property
     def cached_user(self):
+        # Set by LikeServices.hydrate_likes for a whole page of likes
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
         return MemcachedHelper.get_instance_via_cache(model_class=User, obj_id=self.user_id)
 
 
 pre_delete.connect(decr_likes_count, sender=Like)
 post_save.connect(incr_likes_count, sender=Like)
+post_save.connect(push_like_to_cache, sender=Like)
+post_delete.connect(remove_like_from_cache, sender=Like)
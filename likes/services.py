@@ -1,5 +1,15 @@
 from .models import Like
+from accounts.services import UserService
 from django.contrib.contenttypes.models import ContentType
+from twitter.cache import TWEET_LIKES_PATTERN
+from utils.redis_helper import RedisHelper
+from utils.redis_serializers import CompactModelSerializer
+
+
+class LikeRedisSerializer(CompactModelSerializer):
+    # The liked tweet is implied by the key, only (id, user_id, created_at) are cached
+    model_class = Like
+    foreign_key = 'user_id'
 
 
 class LikeServices(object):
@@ -14,3 +24,54 @@ class LikeServices(object):
             object_id=obj.id,
         ).exists()
         return has_liked
+
+    @classmethod
+    def get_liked_object_ids(cls, user, model_class, object_ids):
+        # Which of the objects are liked by user, answered by one query on the unique index
+        if user.is_anonymous or not object_ids:
+            return set()
+        liked_object_ids = Like.objects.filter(
+            user=user,
+            content_type=ContentType.objects.get_for_model(model_class),
+            object_id__in=object_ids,
+        ).values_list('object_id', flat=True)
+        return set(liked_object_ids)
+
+    @classmethod
+    def get_tweet_likes_queryset(cls, tweet_id):
+        from tweets.models import Tweet
+        return Like.objects.filter(
+            content_type=ContentType.objects.get_for_model(Tweet),
+            object_id=tweet_id,
+        ).order_by('-created_at', '-id')
+
+    @classmethod
+    def get_cached_tweet_likes_range(cls, tweet_id, below=None, above=None, count=None):
+        key = TWEET_LIKES_PATTERN.format(tweet_id=tweet_id)
+        return RedisHelper.load_sorted_objects_range(
+            key,
+            cls.get_tweet_likes_queryset(tweet_id),
+            LikeRedisSerializer,
+            below=below,
+            above=above,
+            count=count,
+        )
+
+    @classmethod
+    def push_tweet_like_to_cache(cls, like):
+        key = TWEET_LIKES_PATTERN.format(tweet_id=like.object_id)
+        queryset = cls.get_tweet_likes_queryset(like.object_id)
+        RedisHelper.push_single_sorted_object(key, like, queryset, LikeRedisSerializer)
+
+    @classmethod
+    def remove_tweet_like_from_cache(cls, like):
+        key = TWEET_LIKES_PATTERN.format(tweet_id=like.object_id)
+        RedisHelper.remove_sorted_object(key, like, LikeRedisSerializer)
+
+    @classmethod
+    def hydrate_likes(cls, likes):
+        # Attach the user cards of a page of likes, loaded in batch
+        user_cards = UserService.get_user_cards(set(like.user_id for like in likes if like.user_id is not None))
+        for like in likes:
+            if like.user_id in user_cards:
+                like._cached_user = user_cards[like.user_id]
@@ -1,11 +1,28 @@
 from rest_framework import serializers
 from newsfeeds.models import NewsFeed
-from tweets.api.serializers import TweetSerializer
+from tweets.api.serializers import TweetSerializer, hydrate_tweets
+from tweets.services import TweetService
 
 
+class NewsFeedListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        newsfeeds = list(data)
+        tweet_ids = set(newsfeed.tweet_id for newsfeed in newsfeeds)
+        tweets = TweetService.get_tweet_views(tweet_ids)
+        for newsfeed in newsfeeds:
+            if newsfeed.tweet_id in tweets:
+                newsfeed._cached_tweet = tweets[newsfeed.tweet_id]
+        hydrate_tweets(list(tweets.values()), self.context)
+        return super(NewsFeedListSerializer, self).to_representation(newsfeeds)
+
+
+# Serializes NewsFeed as well as FeedEntry read from cache. Newsfeeds pulled from pull mode
+# users have no row in DB, their id is null
 class NewsFeedSerializer(serializers.ModelSerializer):
     tweet = TweetSerializer(source='cached_tweet')
 
     class Meta:
         model = NewsFeed
         fields = ('id', 'tweet', 'created_at')
+        list_serializer_class = NewsFeedListSerializer
@@ -1,3 +1,6 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
 from friendships.models import Friendship
@@ -164,6 +167,36 @@ class NewsFeedAPITests(TestCase):
         results = response.data['results']
         self.assertEqual(results[0]['tweet']['content'], 'content2')
 
+    def _get_newsfeeds_with_query_count(self, client):
+        # Warm up caches first, then count DB queries of the cached request
+        client.get(NEWSFEEDS_URL)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(NEWSFEEDS_URL)
+        return response.data['results'], len(queries)
+
+    def test_list_hydration(self):
+        followed_user = self.create_user('followed')
+        tweet = self.create_tweet(followed_user)
+        self.create_newsfeed(self.zhekang, tweet.id)
+        self.create_like(self.zhekang, tweet)
+        results, query_count = self._get_newsfeeds_with_query_count(self.zhekang_client)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['tweet']['has_liked'], True)
+        self.assertEqual(results[0]['tweet']['like_count'], 1)
+
+        for i in range(5):
+            tweet = self.create_tweet(self.create_user('author{}'.format(i)))
+            self.create_newsfeed(self.zhekang, tweet.id)
+        self.create_like(self.zhekang, tweet)
+
+        # A page costs the same number of queries regardless of its size
+        results, more_query_count = self._get_newsfeeds_with_query_count(self.zhekang_client)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(more_query_count, query_count)
+        self.assertEqual([r['tweet']['has_liked'] for r in results], [True, False, False, False, False, True])
+        self.assertEqual(results[0]['tweet']['user']['username'], 'author4')
+        self.assertEqual(results[5]['tweet']['user']['username'], 'followed')
+
     def _paginate_to_get_newsfeeds(self, client):
         # paginate until the end
         response = client.get(NEWSFEEDS_URL)
@@ -211,4 +244,28 @@ class NewsFeedAPITests(TestCase):
 
         # cache expired
         self.clear_cache()
-        _test_newsfeeds_after_new_feed_pushed()
\ No newline at end of file
+        _test_newsfeeds_after_new_feed_pushed()
+    @override_settings(NEWSFEED_PULL_MODE_FOLLOWERS_THRESHOLD=1)
+    def test_pull_mode_beyond_cached_window(self):
+        celebrity = self.create_user('celebrity')
+        self.create_friendships(self.zhekang, celebrity)
+        self.create_friendships(self.xiaohe, celebrity)
+        followed_user = self.create_user('followed')
+        tweet_ids = []
+        for i in range(settings.REDIS_LIST_LENGTH_LIMIT + 10):
+            tweet = self.create_tweet(followed_user)
+            self.create_newsfeed(self.zhekang, tweet.id)
+            tweet_ids.append(tweet.id)
+            tweet_ids.append(self.create_tweet(celebrity).id)
+        tweet_ids = tweet_ids[::-1]
+
+        # Tweets of the pull mode user are merged into pages beyond the cached newsfeeds
+        response = self.zhekang_client.get(NEWSFEEDS_URL)
+        results = response.data['results']
+        while response.data['has_next_page']:
+            response = self.zhekang_client.get(NEWSFEEDS_URL, {'cursor': response.data['next_cursor']})
+            results.extend(response.data['results'])
+        self.assertEqual([result['tweet']['id'] for result in results], tweet_ids)
+
+        # Pulled newsfeeds have a null id, the response shape is the same
+        self.assertEqual([result['id'] is None for result in results[:2]], [True, False])
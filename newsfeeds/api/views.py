@@ -1,3 +1,4 @@
+from functools import partial
 from django.utils.decorators import method_decorator
 from django_ratelimit.decorators import ratelimit
 from rest_framework import viewsets
@@ -17,12 +18,12 @@ class NewsFeedViewSet(viewsets.GenericViewSet):
 
     @method_decorator(ratelimit(key='user', rate='5/s', method='GET', block=True))
     def list(self, request):
-        cached_newsfeeds = NewsFeedServices.get_cached_newsfeeds(user_id=request.user.id)
-        page = self.paginator.paginate_cached_list(cached_newsfeeds, request)
-
-        if page is None:
-            page = self.paginate_queryset(self.get_queryset())
-
+        # Newsfeeds beyond the cached window are read from DB by the service, so that tweets
+        # of pull mode users are merged into them as well
+        page = self.paginator.paginate_range(
+            partial(NewsFeedServices.get_newsfeeds_range, request.user.id),
+            request,
+        )
         serializer = NewsFeedSerializer(
             page,
             context={'request': request},
@@ -0,0 +1,19 @@
+class FeedEntry:
+    # Read model of a newsfeed decoded from the cached sorted set, or pulled from the
+    # tweets of a pull mode user in which case it has no id
+    __slots__ = ('id', 'user_id', 'tweet_id', 'created_at', '_cached_tweet')
+
+    def __init__(self, id=None, user_id=None, tweet_id=None, created_at=None):
+        self.id = id
+        self.user_id = user_id
+        self.tweet_id = tweet_id
+        self.created_at = created_at
+        self._cached_tweet = None
+
+    @property
+    def cached_tweet(self):
+        # Set by NewsFeedListSerializer for a whole page of newsfeeds
+        if self._cached_tweet is None:
+            from tweets.services import TweetService
+            self._cached_tweet = TweetService.get_tweet_views([self.tweet_id]).get(self.tweet_id)
+        return self._cached_tweet
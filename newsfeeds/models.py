@@ -22,6 +22,9 @@ class NewsFeed(models.Model):
 
     @property
     def cached_tweet(self):
+        # Set by NewsFeedListSerializer for a whole page of newsfeeds
+        if hasattr(self, '_cached_tweet'):
+            return self._cached_tweet
         return MemcachedHelper.get_instance_via_cache(model_class=Tweet, obj_id=self.tweet_id)
 
 
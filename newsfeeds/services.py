@@ -1,7 +1,25 @@
+import heapq
+from itertools import islice
+from django.conf import settings
+from django.core.cache import caches
+from friendships.services import FriendshipServices
+from newsfeeds.dtos import FeedEntry
 from newsfeeds.models import NewsFeed
-from newsfeeds.tasks import fanout_newsfeeds_main_task
-from twitter.cache import USER_NEWSFEEDS_PATTERN
+from newsfeeds.tasks import fanout_newsfeeds_main_task, invalidate_followers_pull_mode_caches_task
+from tweets.services import TweetService
+from twitter.cache import PULL_MODE_FOLLOWINGS_PATTERN, USER_NEWSFEEDS_PATTERN
+from utils.paginations import EndlessPagination
 from utils.redis_helper import RedisHelper
+from utils.redis_serializers import CompactModelSerializer
+
+
+class NewsFeedRedisSerializer(CompactModelSerializer):
+    # The owner of newsfeeds is implied by the key, only (id, tweet_id, created_at) are cached
+    # and decoded to FeedEntry
+    model_class = FeedEntry
+    foreign_key = 'tweet_id'
+
+cache = caches['testing'] if settings.TESTING else caches['default']
 
 
 class NewsFeedServices(object):
@@ -10,14 +28,134 @@ class NewsFeedServices(object):
     def fanout_to_followers(cls, tweet):
         fanout_newsfeeds_main_task.delay(tweet.id, tweet.user_id)
 
+    @classmethod
+    def is_pull_mode_user(cls, user_id):
+        followers_count = FriendshipServices.get_followers_count(user_id)
+        return followers_count > settings.NEWSFEED_PULL_MODE_FOLLOWERS_THRESHOLD
+
+    @classmethod
+    def get_pull_mode_following_ids(cls, user_id):
+        # Cached per reader, so reading newsfeeds does not check the followers count of every
+        # following. It is invalidated when the reader follows or unfollows someone, and when
+        # a following crosses the threshold, see followers_count_changed
+        key = PULL_MODE_FOLLOWINGS_PATTERN.format(user_id=user_id)
+        pull_mode_user_ids = cache.get(key)
+        if pull_mode_user_ids is not None:
+            return pull_mode_user_ids
+
+        following_ids = FriendshipServices.get_following_user_id_set(user_id)
+        followers_counts = FriendshipServices.get_followers_counts(following_ids)
+        pull_mode_user_ids = [
+            following_id
+            for following_id, followers_count in followers_counts.items()
+            if followers_count > settings.NEWSFEED_PULL_MODE_FOLLOWERS_THRESHOLD
+        ]
+        cache.set(key, pull_mode_user_ids, timeout=settings.NEWSFEED_PULL_MODE_FOLLOWINGS_CACHE_TIMEOUT)
+        return pull_mode_user_ids
+
+    @classmethod
+    def invalidate_pull_mode_following_cache(cls, user_id):
+        key = PULL_MODE_FOLLOWINGS_PATTERN.format(user_id=user_id)
+        cache.delete(key)
+
+    @classmethod
+    def invalidate_pull_mode_following_caches(cls, user_ids):
+        cache.delete_many([PULL_MODE_FOLLOWINGS_PATTERN.format(user_id=user_id) for user_id in user_ids])
+
+    @classmethod
+    def followers_count_changed(cls, user_id, delta):
+        # Fanout switches mode as soon as the followers count crosses the threshold, the
+        # followers' cached lists are dropped so that reading switches along with it
+        threshold = settings.NEWSFEED_PULL_MODE_FOLLOWERS_THRESHOLD
+        followers_count = FriendshipServices.get_followers_count(user_id)
+        if followers_count == (threshold + 1 if delta > 0 else threshold):
+            invalidate_followers_pull_mode_caches_task.delay(user_id)
+
     @classmethod
     def get_cached_newsfeeds(cls, user_id):
+        newsfeeds, _ = cls.get_cached_newsfeeds_range(user_id, count=settings.REDIS_LIST_LENGTH_LIMIT)
+        return newsfeeds
+
+    @classmethod
+    def _load_cached_newsfeeds_range(cls, user_id, below=None, above=None, count=None):
         key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
-        queryset = NewsFeed.objects.filter(user_id=user_id).order_by('-created_at')
-        return RedisHelper.load_objects(key, queryset)
+        queryset = NewsFeed.objects.filter(user_id=user_id).order_by('-created_at', '-id')
+        newsfeeds, complete = RedisHelper.load_sorted_objects_range(
+            key,
+            queryset,
+            NewsFeedRedisSerializer,
+            below=below,
+            above=above,
+            count=count,
+        )
+        # Cached entries do not hold the owner, which is the owner of the key
+        for newsfeed in newsfeeds:
+            newsfeed.user_id = user_id
+        return newsfeeds, complete
+
+    @classmethod
+    def get_cached_newsfeeds_range(cls, user_id, below=None, above=None, count=None):
+        # See RedisHelper.load_sorted_objects_range for the range arguments
+        newsfeeds, complete = cls._load_cached_newsfeeds_range(user_id, below, above, count)
+        return cls.merge_pulled_newsfeeds(user_id, newsfeeds, below, above, count), complete
+
+    @classmethod
+    def get_newsfeeds_range(cls, user_id, below=None, above=None, count=None):
+        # Same as get_cached_newsfeeds_range, except that pushed newsfeeds beyond the cached
+        # window are read from DB, so pulled tweets are merged into pages beyond it as well
+        newsfeeds, complete = cls._load_cached_newsfeeds_range(user_id, below, above, count)
+        if count is not None and len(newsfeeds) < count and not complete:
+            queryset = EndlessPagination.filter_range(NewsFeed.objects.filter(user_id=user_id), below, above)
+            newsfeeds = list(queryset[:count])
+        return cls.merge_pulled_newsfeeds(user_id, newsfeeds, below, above, count)
+
+    @classmethod
+    def merge_pulled_newsfeeds(cls, user_id, newsfeeds, below=None, above=None, count=None):
+        pull_mode_user_ids = cls.get_pull_mode_following_ids(user_id)
+        if not pull_mode_user_ids:
+            return newsfeeds
+
+        # Pulled newsfeeds have no id and are ordered after pushed ones created at the same
+        # time, so the tweets created at the time of `below` are in range unless `below`
+        # itself is a pulled newsfeed
+        tweets_below = below
+        if below is not None:
+            tweets_below = (below[0] + 1, 0) if below[1] else (below[0], 0)
+
+        # Tweets fanned out before the author switched to pull mode are already in newsfeeds
+        pushed_tweet_ids = set(newsfeed.tweet_id for newsfeed in newsfeeds)
+        ordered_lists = [newsfeeds]
+        for pull_mode_user_id in pull_mode_user_ids:
+            tweets = TweetService.get_tweets_range(
+                pull_mode_user_id,
+                below=tweets_below,
+                above=above,
+                count=count,
+            )
+            ordered_lists.append([
+                FeedEntry(user_id=user_id, tweet_id=tweet.id, created_at=tweet.created_at)
+                for tweet in tweets
+                if tweet.id not in pushed_tweet_ids
+            ])
+
+        # K-way merge of the ranges ordered by (created_at, id) desc
+        merged = heapq.merge(
+            *ordered_lists,
+            key=lambda newsfeed: (newsfeed.created_at, newsfeed.id or 0),
+            reverse=True,
+        )
+        return list(islice(merged, count))
 
     @classmethod
     def push_newsfeed_to_cache(cls, newsfeed):
         key = USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id)
-        queryset = NewsFeed.objects.filter(user_id=newsfeed.user_id).order_by('-created_at')
-        RedisHelper.push_single_object(key, newsfeed, queryset)
\ No newline at end of file
+        queryset = NewsFeed.objects.filter(user_id=newsfeed.user_id).order_by('-created_at', '-id')
+        RedisHelper.push_single_sorted_object(key, newsfeed, queryset, NewsFeedRedisSerializer)
+
+    @classmethod
+    def push_newsfeeds_to_cache(cls, newsfeeds):
+        keyed_newsfeeds = [
+            (USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id), newsfeed)
+            for newsfeed in newsfeeds
+        ]
+        RedisHelper.push_objects_to_cached_sorted_sets(keyed_newsfeeds, NewsFeedRedisSerializer)
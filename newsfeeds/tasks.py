@@ -1,4 +1,5 @@
 from celery import shared_task
+from itertools import islice
 from friendships.services import FriendshipServices
 from newsfeeds.constants import FANOUT_BATCH_SIZE
 from newsfeeds.models import NewsFeed
@@ -13,28 +14,53 @@ def fanout_newsfeeds_batch_task(tweet_id, follower_ids):
                  for follower_id in follower_ids]
     NewsFeed.objects.bulk_create(newsfeeds)
 
+    # MySQL does not return ids from bulk_create, reload the batch by the (user, tweet) unique index
+    newsfeeds = NewsFeed.objects.filter(tweet_id=tweet_id, user_id__in=follower_ids)
+
     # Bulk_create does not trigger post_save so it is needed to manually push it to cache
-    for newsfeed in newsfeeds:
-        NewsFeedServices.push_newsfeed_to_cache(newsfeed)
+    NewsFeedServices.push_newsfeeds_to_cache(newsfeeds)
 
     return "{} newsfeeds created".format(len(newsfeeds))
 
 
 @shared_task(routing_key='default', time_limit=ONE_HOUR)
 def fanout_newsfeeds_main_task(tweet_id, tweet_user_id):
+    from newsfeeds.services import NewsFeedServices
+
     # Create Newsfeed for tweet owner
     NewsFeed.objects.create(tweet_id=tweet_id, user_id=tweet_user_id)
 
-    # Distribute tasks
-    follower_ids = FriendshipServices.get_all_follower_ids(tweet_user_id)
-    index = 0
-    while index < len(follower_ids):
-        batch_ids = follower_ids[index: index + FANOUT_BATCH_SIZE]
+    # Followers of pull mode users merge the tweet into newsfeeds when reading
+    if NewsFeedServices.is_pull_mode_user(tweet_user_id):
+        return 'Pull mode user, fanout skipped.'
+
+    # Distribute tasks while follower ids are streamed, only one batch is held in memory
+    follower_ids = FriendshipServices.iter_follower_ids(tweet_user_id)
+    followers_count, batches_count = 0, 0
+    while True:
+        batch_ids = list(islice(follower_ids, FANOUT_BATCH_SIZE))
+        if not batch_ids:
+            break
         fanout_newsfeeds_batch_task.delay(tweet_id=tweet_id, follower_ids=batch_ids)
-        index += FANOUT_BATCH_SIZE
+        followers_count += len(batch_ids)
+        batches_count += 1
+
+    return '{} newsfeeds going to fanout, {} batches created.'.format(followers_count, batches_count)
+
+
+
+@shared_task(routing_key='default', time_limit=ONE_HOUR)
+def invalidate_followers_pull_mode_caches_task(user_id):
+    from newsfeeds.services import NewsFeedServices
 
-    return '{} newsfeeds going to fanout, {} batches created.'.format(
-        len(follower_ids),
-        (len(follower_ids) - 1) // FANOUT_BATCH_SIZE + 1,
-    )
+    # Follower ids are streamed, the cached lists are deleted one batch at a time
+    follower_ids = FriendshipServices.iter_follower_ids(user_id)
+    followers_count = 0
+    while True:
+        batch_ids = list(islice(follower_ids, FANOUT_BATCH_SIZE))
+        if not batch_ids:
+            break
+        NewsFeedServices.invalidate_pull_mode_following_caches(batch_ids)
+        followers_count += len(batch_ids)
 
+    return '{} pull mode followings caches invalidated.'.format(followers_count)
@@ -1,7 +1,12 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from friendships.models import Friendship
 from newsfeeds.services import NewsFeedServices
 from newsfeeds.models import NewsFeed
+from utils.paginations import EndlessPagination
 from testing.testcases import TestCase
-from newsfeeds.tasks import fanout_newsfeeds_main_task
+from newsfeeds.tasks import fanout_newsfeeds_main_task, fanout_newsfeeds_batch_task
 from twitter.cache import USER_NEWSFEEDS_PATTERN
 from utils.redis_client import RedisClient
 
@@ -40,7 +45,7 @@ class NewsFeedServiceTests(TestCase):
         feed1 = self.create_newsfeed(self.zhekang, self.create_tweet(self.zhekang).id)
 
         RedisClient.clear()
-        conn = RedisClient.get_connection()
+        conn = RedisClient.get_connection('feeds')
 
         key = USER_NEWSFEEDS_PATTERN.format(user_id=self.zhekang.id)
         self.assertEqual(conn.exists(key), False)
@@ -51,6 +56,70 @@ class NewsFeedServiceTests(TestCase):
         self.assertEqual([f.id for f in feeds], [feed2.id, feed1.id])
 
 
+    def test_compact_newsfeeds_cache(self):
+        newsfeeds = [
+            self.create_newsfeed(self.zhekang, self.create_tweet(self.xiaohe).id)
+            for _ in range(2)
+        ]
+        newsfeeds = newsfeeds[::-1]
+
+        # Only ids are cached in the member, created_at is kept as score in microseconds
+        NewsFeedServices.get_cached_newsfeeds(self.zhekang.id)
+        conn = RedisClient.get_connection('feeds')
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=self.zhekang.id)
+        entries = conn.zrevrange(key, 0, -1)
+        self.assertEqual([len(entry) for entry in entries], [16, 16])
+
+        # Cache hit keeps id, tweet_id and the full precision of created_at, the owner is
+        # filled from the key
+        cached_newsfeeds = NewsFeedServices.get_cached_newsfeeds(self.zhekang.id)
+        for cached_newsfeed, newsfeed in zip(cached_newsfeeds, newsfeeds):
+            self.assertEqual(cached_newsfeed.id, newsfeed.id)
+            self.assertEqual(cached_newsfeed.user_id, self.zhekang.id)
+            self.assertEqual(cached_newsfeed.tweet_id, newsfeed.tweet_id)
+            self.assertEqual(cached_newsfeed.created_at, newsfeed.created_at)
+
+    @override_settings(NEWSFEED_PULL_MODE_FOLLOWERS_THRESHOLD=1)
+    def test_pull_mode_following_ids_cache(self):
+        celebrity = self.create_user('celebrity')
+        self.create_friendships(self.xiaohe, celebrity)
+        self.create_friendships(self.zhekang, celebrity)
+        self.assertEqual(NewsFeedServices.get_pull_mode_following_ids(self.zhekang.id), [celebrity.id])
+
+        # Cache hit does not read followings or their followers counts
+        with CaptureQueriesContext(connection) as queries:
+            pull_mode_user_ids = NewsFeedServices.get_pull_mode_following_ids(self.zhekang.id)
+        self.assertEqual(pull_mode_user_ids, [celebrity.id])
+        self.assertEqual(len(queries), 0)
+
+        # Following someone else invalidates it
+        another_celebrity = self.create_user('another_celebrity')
+        self.create_friendships(self.xiaohe, another_celebrity)
+        self.create_friendships(self.zhekang, another_celebrity)
+        self.assertEqual(
+            sorted(NewsFeedServices.get_pull_mode_following_ids(self.zhekang.id)),
+            [celebrity.id, another_celebrity.id],
+        )
+
+
+    @override_settings(NEWSFEED_PULL_MODE_FOLLOWERS_THRESHOLD=1)
+    def test_pull_mode_following_ids_cache_on_threshold(self):
+        self.create_friendships(self.zhekang, self.xiaohe)
+        self.assertEqual(NewsFeedServices.get_pull_mode_following_ids(self.zhekang.id), [])
+
+        # Crossing the threshold invalidates the cached lists of the followers, the tweets
+        # which are not fanned out any more are pulled right away
+        self.create_friendships(self.create_user('user'), self.xiaohe)
+        self.assertEqual(NewsFeedServices.get_pull_mode_following_ids(self.zhekang.id), [self.xiaohe.id])
+        tweet = self.create_tweet(self.xiaohe)
+        self.assertEqual(fanout_newsfeeds_main_task(tweet.id, self.xiaohe.id), 'Pull mode user, fanout skipped.')
+        newsfeeds = NewsFeedServices.get_cached_newsfeeds(self.zhekang.id)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [tweet.id])
+
+        # Crossing it back as well
+        Friendship.objects.filter(to_user=self.xiaohe).exclude(from_user=self.zhekang).delete()
+        self.assertEqual(NewsFeedServices.get_pull_mode_following_ids(self.zhekang.id), [])
+
 class NewsFeedTaskTests(TestCase):
 
     def setUp(self):
@@ -87,3 +156,62 @@ class NewsFeedTaskTests(TestCase):
         self.assertEqual(len(cached_list), 3)
         cached_list = NewsFeedServices.get_cached_newsfeeds(self.xiaohe.id)
         self.assertEqual(len(cached_list), 3)
+
+    def test_fanout_batch_task(self):
+        conn = RedisClient.get_connection('feeds')
+        zhekang_key = USER_NEWSFEEDS_PATTERN.format(user_id=self.zhekang.id)
+        xiaohe_key = USER_NEWSFEEDS_PATTERN.format(user_id=self.xiaohe.id)
+
+        # Load zhekang's newsfeeds to cache, xiaohe's are not cached
+        NewsFeedServices.get_cached_newsfeeds(self.zhekang.id)
+        self.assertEqual(conn.exists(zhekang_key), False)
+        self.create_newsfeed(self.zhekang, self.create_tweet(self.xiaohe).id)
+        self.assertEqual(conn.exists(zhekang_key), True)
+
+        tweet = self.create_tweet(self.xiaohe)
+        msg = fanout_newsfeeds_batch_task(tweet.id, [self.zhekang.id, self.xiaohe.id])
+        self.assertEqual(msg, '2 newsfeeds created')
+
+        # Cached list is pushed, uncached list is skipped instead of rebuilt
+        cached_list = NewsFeedServices.get_cached_newsfeeds(self.zhekang.id)
+        self.assertEqual(len(cached_list), 2)
+        self.assertEqual(cached_list[0].tweet_id, tweet.id)
+        self.assertNotEqual(cached_list[0].id, None)
+        self.assertEqual(conn.exists(xiaohe_key), False)
+
+        # Skipped list is loaded from DB on the next read
+        cached_list = NewsFeedServices.get_cached_newsfeeds(self.xiaohe.id)
+        self.assertEqual([f.tweet_id for f in cached_list], [tweet.id])
+        self.assertEqual(conn.exists(xiaohe_key), True)
+
+    @override_settings(NEWSFEED_PULL_MODE_FOLLOWERS_THRESHOLD=1)
+    def test_fanout_main_task_in_pull_mode(self):
+        # One follower is still in push mode
+        self.create_friendships(self.xiaohe, self.zhekang)
+        pushed_tweet = self.create_tweet(self.zhekang, 'pushed tweet')
+        msg = fanout_newsfeeds_main_task(pushed_tweet.id, self.zhekang.id)
+        self.assertEqual(msg, '1 newsfeeds going to fanout, 1 batches created.')
+        self.assertEqual(NewsFeed.objects.count(), 2)
+
+        # Fanout is skipped above the threshold, only owner's newsfeed is created
+        self.create_friendships(self.create_user('user'), self.zhekang)
+        pulled_tweet = self.create_tweet(self.zhekang, 'pulled tweet')
+        msg = fanout_newsfeeds_main_task(pulled_tweet.id, self.zhekang.id)
+        self.assertEqual(msg, 'Pull mode user, fanout skipped.')
+        self.assertEqual(NewsFeed.objects.count(), 3)
+
+        # Pulled tweets are merged with pushed newsfeeds by created_at without duplicates
+        own_tweet = self.create_tweet(self.xiaohe, 'own tweet')
+        self.create_newsfeed(self.xiaohe, own_tweet.id)
+        newsfeeds = NewsFeedServices.get_cached_newsfeeds(self.xiaohe.id)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [own_tweet.id, pulled_tweet.id, pushed_tweet.id],
+        )
+
+        # Pages are merged from the same range of pushed newsfeeds and pulled tweets
+        newsfeeds, _ = NewsFeedServices.get_cached_newsfeeds_range(self.xiaohe.id, count=2)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [own_tweet.id, pulled_tweet.id])
+        below = EndlessPagination.get_sort_key(newsfeeds[-1])
+        newsfeeds, _ = NewsFeedServices.get_cached_newsfeeds_range(self.xiaohe.id, below=below, count=2)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [pushed_tweet.id])
@@ -1,15 +1,40 @@
+from functools import partial
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
 from accounts.api.serializers import UserSerializerForTweetAndFriendship
 from comments.api.serializers import CommentSerializer
+from comments.services import CommentService
 from likes.api.serializers import LikeSerializer
 from likes.services import LikeServices
 from tweets.models import Tweet, TweetPhoto
 from tweets.services import TweetService
-from tweets.constants import TWEET_PHOTOS_UPLOAD_LIMIT
+from tweets.constants import (
+    TWEET_PHOTOS_UPLOAD_LIMIT,
+    TWEET_DETAIL_COMMENTS_LIMIT,
+    TWEET_DETAIL_LIKES_LIMIT,
+)
 from rest_framework.exceptions import ValidationError
+from utils.paginations import EndlessPagination
 from utils.redis_helper import RedisHelper
 
 
+def hydrate_tweets(tweets, context):
+    # Load the fields of a whole page up front, TweetSerializer reads them from context
+    hydrated_tweets = TweetService.hydrate_tweets(tweets, context['request'].user)
+    context.setdefault('hydrated_tweets', {}).update(hydrated_tweets)
+
+
+class TweetListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        tweets = list(iterable)
+        hydrate_tweets(tweets, self.context)
+        return super(TweetListSerializer, self).to_representation(tweets)
+
+
+# Serializes Tweet as well as TweetView read from cache
 class TweetSerializer(serializers.ModelSerializer):
     user = UserSerializerForTweetAndFriendship(source='cached_user')
     like_count = serializers.SerializerMethodField()
@@ -29,18 +54,39 @@ class TweetSerializer(serializers.ModelSerializer):
             'has_liked',
             'photo_urls',
         )
+        list_serializer_class = TweetListSerializer
+
+    def get_hydrated_field(self, obj, field_name):
+        hydrated_tweet = self.context.get('hydrated_tweets', {}).get(obj.id)
+        if hydrated_tweet is None:
+            return None
+        return hydrated_tweet[field_name]
 
     def get_like_count(self, obj):
-        return RedisHelper.get_count(obj, 'likes_count')
+        hydrated_count = self.get_hydrated_field(obj, 'like_count')
+        if hydrated_count is not None:
+            return hydrated_count
+        return RedisHelper.get_count(Tweet(id=obj.id), 'likes_count')
 
     def get_has_liked(self, obj):
-        return LikeServices.has_liked(self.context['request'].user, obj)
+        hydrated_has_liked = self.get_hydrated_field(obj, 'has_liked')
+        if hydrated_has_liked is not None:
+            return hydrated_has_liked
+        return LikeServices.has_liked(self.context['request'].user, Tweet(id=obj.id))
 
     def get_comments_count(self, obj):
-        return RedisHelper.get_count(obj, 'comments_count')
+        hydrated_count = self.get_hydrated_field(obj, 'comments_count')
+        if hydrated_count is not None:
+            return hydrated_count
+        return RedisHelper.get_count(Tweet(id=obj.id), 'comments_count')
 
     def get_photo_urls(self, obj):
-        tweet_photos = TweetPhoto.objects.filter(tweet=obj).order_by('order')
+        hydrated_photo_urls = self.get_hydrated_field(obj, 'photo_urls')
+        if hydrated_photo_urls is not None:
+            return hydrated_photo_urls
+        if obj.photo_names is not None:
+            return TweetService.get_photo_urls_from_names(obj.photo_names)
+        tweet_photos = TweetPhoto.objects.filter(tweet_id=obj.id).order_by('order')
         photo_urls = []
         for photo in tweet_photos:
             photo_urls.append(photo.file.url)
@@ -48,9 +94,8 @@ class TweetSerializer(serializers.ModelSerializer):
 
 
 class TweetSerializerWithDetails(TweetSerializer):
-
-    comments = CommentSerializer(source='comment_set', many=True)
-    likes = LikeSerializer(source='like_set', many=True)
+    # Only the newest comments and likes are embedded, each with the cursor to continue
+    # from on /api/comments/?tweet_id= and /api/tweets/{id}/likes/ respectively
 
     class Meta:
         model = Tweet
@@ -59,14 +104,34 @@ class TweetSerializerWithDetails(TweetSerializer):
             'user',
             'content',
             'created_at',
-            'comments',
-            'likes',
             'like_count',
             'comments_count',
             'has_liked',
             'photo_urls',
             )
 
+    def to_representation(self, instance):
+        data = super(TweetSerializerWithDetails, self).to_representation(instance)
+
+        paginator = EndlessPagination()
+        paginator.page_size = TWEET_DETAIL_COMMENTS_LIMIT
+        comments = paginator.paginate_cached_first_page(
+            partial(CommentService.get_cached_comments_range, instance.id),
+            CommentService.get_tweet_comments_queryset(instance.id),
+        )
+        data['comments'] = CommentSerializer(comments, many=True, context=self.context).data
+        data['comments_next_cursor'] = paginator.next_cursor
+
+        paginator = EndlessPagination()
+        paginator.page_size = TWEET_DETAIL_LIKES_LIMIT
+        likes = paginator.paginate_cached_first_page(
+            partial(LikeServices.get_cached_tweet_likes_range, instance.id),
+            LikeServices.get_tweet_likes_queryset(instance.id),
+        )
+        data['likes'] = LikeSerializer(likes, many=True, context=self.context).data
+        data['likes_next_cursor'] = paginator.next_cursor
+        return data
+
 
 class TweetSerializerForCreate(serializers.ModelSerializer):
     content = serializers.CharField(max_length=140, min_length=6)
@@ -91,6 +156,8 @@ class TweetSerializerForCreate(serializers.ModelSerializer):
         content = validated_data['content']
         user = self.context['request'].user
         tweet = Tweet.objects.create(content=content, user=user)
-        if validated_data.get('files'):
+        if validated_data.get('files') and settings.TWEET_PHOTOS_ASYNC_UPLOAD:
+            TweetService.stage_photos_from_files(tweet=tweet, files=validated_data['files'])
+        elif validated_data.get('files'):
             TweetService.create_photos_from_files(tweet=tweet, files=validated_data['files'])
         return tweet
@@ -1,12 +1,22 @@
+import os
+import tempfile
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from io import BytesIO
+from PIL import Image
 from rest_framework.test import APIClient
+from unittest import mock
 from testing.testcases import TestCase
+from tweets.constants import TweetPhotoStatus, TWEET_DETAIL_COMMENTS_LIMIT, TWEET_DETAIL_LIKES_LIMIT
 from tweets.models import Tweet, TweetPhoto
+from tweets.tasks import ingest_tweet_photos_task
 from django.core.files.uploadedfile import SimpleUploadedFile
 from utils.paginations import EndlessPagination
 
 TWEET_LIST_API = '/api/tweets/'
 TWEET_CREATE_API = '/api/tweets/'
 TWEET_RETRIEVE_API = '/api/tweets/{}/'
+TWEET_LIKES_API = '/api/tweets/{}/likes/'
 NEWSFEED_LIST_API = '/api/newsfeeds/'
 
 
@@ -63,6 +73,41 @@ class TweetAPITests(TestCase):
         self.assertEqual(response.data['user']['nickname'], profile.nickname)
         self.assertEqual('avatar_url' in response.data['user'], True)
 
+    def test_retrieve_bounded(self):
+        tweet = self.create_tweet(self.user1)
+        comments = [self.create_comment(self.user2, tweet.id) for _ in range(TWEET_DETAIL_COMMENTS_LIMIT + 1)]
+        likes = [
+            self.create_like(self.create_user('liker{}'.format(i)), tweet)
+            for i in range(TWEET_DETAIL_LIKES_LIMIT + 1)
+        ]
+
+        # Only the newest comments and likes are embedded
+        response = self.anonymous_client.get(TWEET_RETRIEVE_API.format(tweet.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['comments']), TWEET_DETAIL_COMMENTS_LIMIT)
+        self.assertEqual(response.data['comments'][0]['id'], comments[-1].id)
+        self.assertNotEqual(response.data['comments_next_cursor'], None)
+        self.assertEqual(len(response.data['likes']), TWEET_DETAIL_LIKES_LIMIT)
+        self.assertEqual(response.data['likes'][0]['user']['id'], likes[-1].user_id)
+
+        # The rest of the likes continue from the cursor
+        response = self.anonymous_client.get(
+            TWEET_LIKES_API.format(tweet.id),
+            {'cursor': response.data['likes_next_cursor']},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual([like['user']['id'] for like in response.data['results']], [likes[0].user_id])
+
+        # Deleted comments and canceled likes are removed from the cached lists
+        comments[-1].delete()
+        likes[-1].delete()
+        response = self.anonymous_client.get(TWEET_RETRIEVE_API.format(tweet.id))
+        self.assertEqual(response.data['comments'][0]['id'], comments[-2].id)
+        self.assertEqual(response.data['comments_next_cursor'], None)
+        self.assertEqual(response.data['likes'][0]['user']['id'], likes[-2].user_id)
+        self.assertEqual(response.data['likes_next_cursor'], None)
+
     def test_create_api(self):
         # Visitor not allowed to create tweet
         response = self.anonymous_client.post(TWEET_CREATE_API)
@@ -145,6 +190,52 @@ class TweetAPITests(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertEqual(TweetPhoto.objects.count(), 4)
 
+    def test_create_with_files_async(self):
+        files = []
+        for i in range(3):
+            buffer = BytesIO()
+            Image.new('RGB', (800, 600)).save(buffer, format='JPEG')
+            files.append(SimpleUploadedFile(
+                name='selfie_{}.jpg'.format(i),
+                content=buffer.getvalue(),
+                content_type='image/jpeg',
+            ))
+        with tempfile.TemporaryDirectory() as staging_root, override_settings(
+            TWEET_PHOTOS_ASYNC_UPLOAD=True,
+            TWEET_PHOTOS_STAGING_OPTIONS={'location': staging_root},
+        ):
+            # The tweet is created with photos staged for upload, the task is only queued
+            # once the tweet is committed
+            with mock.patch.object(ingest_tweet_photos_task, 'delay') as delay:
+                with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                    response = self.user1_client.post(TWEET_CREATE_API, {
+                        'content': 'tweet with 3 pics',
+                        'files': files,
+                    })
+                    delay.assert_not_called()
+            self.assertEqual(len(callbacks), 1)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['photo_urls'], [])
+            delay.assert_called_once_with(response.data['id'])
+            photos = TweetPhoto.objects.filter(tweet_id=response.data['id'])
+            self.assertEqual(photos.filter(status=TweetPhotoStatus.PENDING).count(), 3)
+            self.assertEqual(sorted(os.listdir(staging_root)), sorted(photo.file.name for photo in photos))
+
+            # The worker uploads them with their variants, approves them and publishes them
+            ingest_tweet_photos_task(response.data['id'])
+            self.assertEqual(photos.filter(status=TweetPhotoStatus.APPROVED).count(), 3)
+            self.assertEqual(os.listdir(staging_root), [])
+            for photo in photos.all():
+                self.assertTrue(default_storage.exists(photo.file.name))
+                root, ext = os.path.splitext(photo.file.name)
+                small = Image.open(default_storage.open('{}_small{}'.format(root, ext)))
+                self.assertEqual(small.size, (240, 180))
+                self.assertTrue(default_storage.exists('{}_medium{}'.format(root, ext)))
+            response = self.user1_client.get(TWEET_RETRIEVE_API.format(response.data['id']))
+            self.assertEqual(len(response.data['photo_urls']), 3)
+            for i in range(3):
+                self.assertIn('selfie_{}'.format(i), response.data['photo_urls'][i])
+
     def test_comments_count(self):
         zhekang = self.create_user('zhekang')
         zhekang_client = APIClient()
@@ -218,4 +309,37 @@ class TweetAPITests(TestCase):
         })
         self.assertEqual(response.data['has_next_page'], False)
         self.assertEqual(len(response.data['results']), 1)
-        self.assertEqual(response.data['results'][0]['id'], new_tweet.id)
\ No newline at end of file
+        self.assertEqual(response.data['results'][0]['id'], new_tweet.id)
+
+    def _paginate_with_cursor(self, user_id):
+        response = self.user1_client.get(TWEET_LIST_API, {'user_id': user_id})
+        results = response.data['results']
+        while response.data['has_next_page']:
+            response = self.user1_client.get(TWEET_LIST_API, {
+                'user_id': user_id,
+                'cursor': response.data['next_cursor'],
+            })
+            results.extend(response.data['results'])
+        self.assertIsNone(response.data['next_cursor'])
+        return [result['id'] for result in results]
+
+    def test_cursor_pagination(self):
+        page_size = EndlessPagination.page_size
+        for i in range(page_size * 2):
+            self.tweets1.append(self.create_tweet(self.user1, 'tweet{}'.format(i)))
+        # Tweets created at the same time are ordered by id
+        Tweet.objects.filter(id__in=[tweet.id for tweet in self.tweets1[10:30]]).update(
+            created_at=self.tweets1[10].created_at,
+        )
+        self.clear_cache()
+        queryset = Tweet.objects.filter(user=self.user1).order_by('-created_at', '-id')
+
+        # Pages are walked with the cursor without duplicates or gaps
+        self.assertEqual(self._paginate_with_cursor(self.user1.id), list(queryset.values_list('id', flat=True)))
+
+        # Pushing a new tweet trims the cached list, pages beyond it are served by DB
+        self.create_tweet(self.user1)
+        self.assertEqual(self._paginate_with_cursor(self.user1.id), list(queryset.values_list('id', flat=True)))
+
+        response = self.user1_client.get(TWEET_LIST_API, {'user_id': self.user1.id, 'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
@@ -1,8 +1,12 @@
+from functools import partial
 from django.utils.decorators import method_decorator
 from django_ratelimit.decorators import ratelimit
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from likes.api.serializers import LikeSerializer
+from likes.services import LikeServices
 from newsfeeds.services import NewsFeedServices
 from tweets.api.serializers import (
     TweetSerializer,
@@ -21,15 +25,17 @@ class TweetViewSet(viewsets.GenericViewSet):
     pagination_class = EndlessPagination
 
     def get_permissions(self):
-        if self.action in ["list", "retrieve"]:
+        if self.action in ["list", "retrieve", "likes"]:
             return [AllowAny()]
         return [IsAuthenticated()]
 
     @required_params(method='GET', params=['user_id'])
     def list(self, request, *args, **kwargs):
         user_id = request.query_params['user_id']
-        cached_tweets = TweetService.get_cached_tweets(user_id=user_id)
-        page = self.paginator.paginate_cached_list(cached_tweets, request)
+        page = self.paginator.paginate_cached_range(
+            partial(TweetService.get_cached_tweets_range, user_id),
+            request,
+        )
         if page is None:
             tweets = Tweet.objects.filter(user_id=user_id).order_by('-created_at')
             page = self.paginate_queryset(tweets)
@@ -44,6 +50,19 @@ class TweetViewSet(viewsets.GenericViewSet):
         )
         return Response(serializer.data)
 
+    @action(methods=['GET'], detail=True)
+    @method_decorator(ratelimit(key='user_or_ip', rate='5/s', method='GET', block=True))
+    def likes(self, request, *args, **kwargs):
+        tweet = self.get_object()
+        page = self.paginator.paginate_cached_range(
+            partial(LikeServices.get_cached_tweet_likes_range, tweet.id),
+            request,
+        )
+        if page is None:
+            page = self.paginate_queryset(LikeServices.get_tweet_likes_queryset(tweet.id))
+        serializer = LikeSerializer(page, context={'request': request}, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @method_decorator(ratelimit(key='user', rate='1/s', method='POST', block=True))
     @method_decorator(ratelimit(key='user', rate='5/m', method='POST', block=True))
     def create(self, request, *args, **kwargs):
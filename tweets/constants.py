@@ -11,3 +11,7 @@ TWEET_PHOTO_STATUS_CHOICES = (
 )
 
 TWEET_PHOTOS_UPLOAD_LIMIT = 9
+
+# Tweet details show the newest comments and likes only, the rest are paginated
+TWEET_DETAIL_COMMENTS_LIMIT = 10
+TWEET_DETAIL_LIKES_LIMIT = 10
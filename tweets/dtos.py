@@ -0,0 +1,99 @@
+from accounts.dtos import UserCard
+from utils.time_helpers import datetime_to_timestamp_us, timestamp_us_to_datetime
+
+
+class TweetView:
+    # Read model of a tweet for lists, counters and photos are hydrated per page. The card of
+    # the author is embedded as a snapshot together with the version of the card it was taken
+    # at, TweetService.hydrate_tweets uses it as long as the version is still the current one
+    __slots__ = (
+        'id',
+        'user_id',
+        'content',
+        'created_at',
+        'user_card',
+        'user_card_version',
+        'photo_names',
+        '_cached_user',
+    )
+
+    def __init__(self, id, user_id, content, created_at, user_card=None, user_card_version=None, photo_names=None):
+        self.id = id
+        self.user_id = user_id
+        self.content = content
+        self.created_at = created_at
+        self.user_card = user_card
+        self.user_card_version = user_card_version
+        self.photo_names = photo_names
+        self._cached_user = None
+
+    @classmethod
+    def from_models(cls, tweets):
+        from accounts.services import UserService
+
+        # Versions are read before the cards, a card changed in between is stale right away
+        user_ids = set(tweet.user_id for tweet in tweets if tweet.user_id is not None)
+        versions = UserService.get_user_card_versions(user_ids)
+        user_cards = UserService.get_user_cards(user_ids)
+        return [
+            cls(
+                tweet.id,
+                tweet.user_id,
+                tweet.content,
+                tweet.created_at,
+                user_cards.get(tweet.user_id),
+                versions.get(tweet.user_id),
+                tweet.photo_names,
+            )
+            for tweet in tweets
+        ]
+
+    @classmethod
+    def from_model(cls, tweet):
+        return cls.from_models([tweet])[0]
+
+    @classmethod
+    def load_many(cls, tweet_ids):
+        from tweets.models import Tweet
+        tweet_views = cls.from_models(list(Tweet.objects.filter(id__in=tweet_ids)))
+        return {tweet_view.id: tweet_view for tweet_view in tweet_views}
+
+    def encode(self):
+        user_card = None if self.user_card is None else self.user_card.encode()
+        return (
+            self.id,
+            self.user_id,
+            self.content,
+            datetime_to_timestamp_us(self.created_at),
+            user_card,
+            self.user_card_version,
+            # Photo urls of the views encoded before photo names were, left out
+            None,
+            self.photo_names,
+        )
+
+    @classmethod
+    def decode(cls, values):
+        # Views encoded before the author snapshot or photo names were added are still decoded,
+        # the photo urls they hold are expired presigned urls and are ignored
+        tweet_id, user_id, content, created_at, *optional_values = values
+        user_card, user_card_version, _, photo_names = (list(optional_values) + [None] * 4)[:4]
+        if user_card is not None:
+            user_card = UserCard.decode(user_card)
+        return cls(
+            tweet_id,
+            user_id,
+            content,
+            timestamp_us_to_datetime(created_at),
+            user_card,
+            user_card_version,
+            photo_names,
+        )
+
+    @property
+    def cached_user(self):
+        # Set by TweetService.hydrate_tweets for a whole page of tweets
+        if self._cached_user is None and self.user_id is not None:
+            from accounts.services import UserService
+            self._cached_user = UserService.get_user_cards([self.user_id]).get(self.user_id)
+        return self._cached_user
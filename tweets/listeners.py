@@ -1,5 +1,11 @@
 def push_tweet_to_cache(sender, instance, created, **kwargs):
+    from tweets.services import TweetService
     if not created:
+        TweetService.update_tweet_in_cache(instance)
         return
-    from tweets.services import TweetService
     TweetService.push_tweet_to_cache(instance)
+
+
+def invalidate_tweet_view(sender, instance, **kwargs):
+    from tweets.services import TweetService
+    TweetService.invalidate_tweet_view(instance.id)
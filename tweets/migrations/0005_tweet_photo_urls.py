@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0004_tweet_comments_count_tweet_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='photo_urls',
+            field=models.JSONField(default=list, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 18:38
+
+from django.db import migrations
+from itertools import groupby
+
+BATCH_SIZE = 1000
+
+
+def backfill_photo_urls(apps, schema_editor):
+    # Tweets created before photo_urls got an empty list when the field was added, the
+    # names of their photos are materialized from TweetPhoto. The field holds names and is
+    # renamed to photo_names by the next migration, urls are presigned and expire
+    Tweet = apps.get_model('tweets', 'Tweet')
+    TweetPhoto = apps.get_model('tweets', 'TweetPhoto')
+
+    photos = TweetPhoto.objects.filter(tweet_id__isnull=False).order_by('tweet_id', 'order').iterator()
+    tweets = []
+    for tweet_id, tweet_photos in groupby(photos, key=lambda photo: photo.tweet_id):
+        tweets.append(Tweet(id=tweet_id, photo_urls=[photo.file.name for photo in tweet_photos]))
+        if len(tweets) >= BATCH_SIZE:
+            Tweet.objects.bulk_update(tweets, ['photo_urls'])
+            tweets = []
+    Tweet.objects.bulk_update(tweets, ['photo_urls'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0006_tweet_comments_count_generation_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_photo_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 19:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0007_backfill_tweet_photo_urls'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='tweet',
+            old_name='photo_urls',
+            new_name='photo_names',
+        ),
+    ]
@@ -1,10 +1,10 @@
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from likes.models import Like
 from tweets.constants import TweetPhotoStatus, TWEET_PHOTO_STATUS_CHOICES
-from tweets.listeners import push_tweet_to_cache
+from tweets.listeners import push_tweet_to_cache, invalidate_tweet_view
 from utils.listeners import invalidate_object_cache
 from utils.memcached_helper import MemcachedHelper
 from utils.time_helpers import utc_now
@@ -18,6 +18,15 @@ class Tweet(models.Model):
     # Add following fields to achieve denormalized like_count and comment_count
     likes_count = models.IntegerField(default=0, null=True)
     comments_count = models.IntegerField(default=0, null=True)
+    # Generation of the last counter deltas flushed to the row in write-behind mode,
+    # see RedisHelper.flush_count_deltas
+    likes_count_generation = models.BigIntegerField(default=0)
+    comments_count_generation = models.BigIntegerField(default=0)
+
+    # Materialized when the photos are uploaded, backfilled for tweets created before the field.
+    # Storage names are kept rather than urls, which are presigned and expire, so urls are
+    # built when tweets are serialized
+    photo_names = models.JSONField(default=list, null=True)
 
     class Meta:
         index_together = (('user', 'created_at'),)
@@ -40,6 +49,9 @@ class Tweet(models.Model):
 
     @property
     def cached_user(self):
+        # Set by TweetService.hydrate_tweets for a whole page of tweets
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
         return MemcachedHelper.get_instance_via_cache(model_class=User, obj_id=self.user_id)
 
 
@@ -70,6 +82,9 @@ class TweetPhoto(models.Model):
 
 # Memcached
 post_save.connect(invalidate_object_cache, sender=Tweet)
+post_save.connect(invalidate_tweet_view, sender=Tweet)
+post_delete.connect(invalidate_object_cache, sender=Tweet)
+post_delete.connect(invalidate_tweet_view, sender=Tweet)
 # Redis
 post_save.connect(push_tweet_to_cache, sender=Tweet)
 
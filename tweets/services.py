@@ -1,6 +1,27 @@
+import os
+from accounts.services import UserService
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.module_loading import import_string
+from io import BytesIO
+from likes.services import LikeServices
+from PIL import Image
+from tweets.dtos import TweetView
+from tweets.constants import TweetPhotoStatus
 from tweets.models import TweetPhoto, Tweet
+from tweets.tasks import ingest_tweet_photos_task
 from twitter.cache import USER_TWEETS_PATTERN
+from utils.memcached_helper import MemcachedHelper
+from utils.paginations import EndlessPagination
 from utils.redis_helper import RedisHelper
+from utils.redis_serializers import DTOSortedSetSerializer
+
+
+class TweetRedisSerializer(DTOSortedSetSerializer):
+    dto_class = TweetView
 
 
 class TweetService(object):
@@ -16,16 +37,190 @@ class TweetService(object):
             )
             photos.append(photo)
         TweetPhoto.objects.bulk_create(photos)
+        # Files are stored by bulk_create, their names are kept on the tweet instead of being
+        # read from TweetPhoto on every read
+        tweet.photo_names = [photo.file.name for photo in photos]
+        tweet.save(update_fields=['photo_names'])
+
+    @classmethod
+    def get_staging_storage(cls):
+        storage_class = import_string(settings.TWEET_PHOTOS_STAGING_STORAGE)
+        return storage_class(**settings.TWEET_PHOTOS_STAGING_OPTIONS)
+
+    @classmethod
+    def stage_photos_from_files(cls, tweet, files):
+        # Files are only written to the staging storage in the request. The photos stay
+        # PENDING with the staged names until ingest_tweet_photos_task uploads them, which is
+        # queued once the tweet is committed so the worker always finds the rows
+        staging_storage = cls.get_staging_storage()
+        photos = []
+        for index, file in enumerate(files):
+            photo = TweetPhoto(
+                tweet=tweet,
+                user=tweet.user,
+                file=staging_storage.save(file.name, file),
+                order=index,
+                status=TweetPhotoStatus.PENDING,
+            )
+            photos.append(photo)
+        TweetPhoto.objects.bulk_create(photos)
+        transaction.on_commit(lambda: ingest_tweet_photos_task.delay(tweet.id))
+
+    @classmethod
+    def save_photo_variants(cls, name, file):
+        # Resized copies are skipped for files which are not images
+        try:
+            image = Image.open(file)
+            image.load()
+        except (OSError, Image.DecompressionBombError):
+            return
+        root, ext = os.path.splitext(name)
+        for variant, size in settings.TWEET_PHOTO_VARIANT_SIZES.items():
+            variant_image = image.copy()
+            variant_image.thumbnail(size)
+            buffer = BytesIO()
+            variant_image.save(buffer, format=image.format)
+            default_storage.save('{}_{}{}'.format(root, variant, ext), ContentFile(buffer.getvalue()))
+
+    @classmethod
+    def upload_staged_photo(cls, staging_storage, staged_name):
+        with staging_storage.open(staged_name) as staged_file:
+            name = default_storage.save(staged_name, staged_file)
+            staged_file.seek(0)
+            cls.save_photo_variants(name, staged_file)
+        return name
+
+    @classmethod
+    def ingest_photos(cls, tweet_id):
+        photos = list(TweetPhoto.objects.filter(
+            tweet_id=tweet_id,
+            status=TweetPhotoStatus.PENDING,
+        ).order_by('order'))
+        if not photos:
+            return 0
+
+        # Uploads are network bound, they run in parallel while DB writes stay in this thread
+        staging_storage = cls.get_staging_storage()
+        staged_names = [photo.file.name for photo in photos]
+        with ThreadPoolExecutor(max_workers=settings.TWEET_PHOTOS_INGEST_WORKERS) as executor:
+            names = list(executor.map(
+                lambda staged_name: cls.upload_staged_photo(staging_storage, staged_name),
+                staged_names,
+            ))
+        for photo, name in zip(photos, names):
+            photo.file.name = name
+            photo.status = TweetPhotoStatus.APPROVED
+        TweetPhoto.objects.bulk_update(photos, ['file', 'status'])
+        for staged_name in staged_names:
+            staging_storage.delete(staged_name)
+
+        tweet = Tweet.objects.get(id=tweet_id)
+        approved_photos = TweetPhoto.objects.filter(
+            tweet_id=tweet_id,
+            status=TweetPhotoStatus.APPROVED,
+        ).order_by('order')
+        tweet.photo_names = [photo.file.name for photo in approved_photos]
+        tweet.save(update_fields=['photo_names'])
+        return len(photos)
 
     @classmethod
     def get_cached_tweets(cls, user_id):
-        queryset = Tweet.objects.filter(user_id=user_id).order_by('-created_at')
+        queryset = Tweet.objects.filter(user_id=user_id).order_by('-created_at', '-id')
+        key = USER_TWEETS_PATTERN.format(user_id=user_id)
+        return RedisHelper.load_sorted_objects(key, queryset, TweetRedisSerializer)
+
+    @classmethod
+    def get_cached_tweets_range(cls, user_id, below=None, above=None, count=None):
+        queryset = Tweet.objects.filter(user_id=user_id).order_by('-created_at', '-id')
         key = USER_TWEETS_PATTERN.format(user_id=user_id)
-        return RedisHelper.load_objects(key, queryset)
+        return RedisHelper.load_sorted_objects_range(
+            key,
+            queryset,
+            TweetRedisSerializer,
+            below=below,
+            above=above,
+            count=count,
+        )
+
+    @classmethod
+    def get_tweets_range(cls, user_id, below=None, above=None, count=None):
+        # Same as get_cached_tweets_range, tweets beyond the cached window are read from DB
+        tweets, complete = cls.get_cached_tweets_range(user_id, below, above, count)
+        if count is None or len(tweets) >= count or complete:
+            return tweets
+        queryset = EndlessPagination.filter_range(Tweet.objects.filter(user_id=user_id), below, above)
+        return list(queryset[:count])
 
     @classmethod
     def push_tweet_to_cache(cls, tweet):
         key = USER_TWEETS_PATTERN.format(user_id=tweet.user_id)
-        queryset = Tweet.objects.filter(user_id=tweet.user_id).order_by('-created_at')
-        RedisHelper.push_single_object(key, tweet, queryset)
+        queryset = Tweet.objects.filter(user_id=tweet.user_id).order_by('-created_at', '-id')
+        RedisHelper.push_single_sorted_object(key, tweet, queryset, TweetRedisSerializer)
+
+    @classmethod
+    def update_tweet_in_cache(cls, tweet):
+        key = USER_TWEETS_PATTERN.format(user_id=tweet.user_id)
+        RedisHelper.update_sorted_object(key, tweet, TweetRedisSerializer)
+
+    @classmethod
+    def get_tweet_views(cls, tweet_ids):
+        return MemcachedHelper.get_dtos_via_cache(TweetView, tweet_ids)
+
+    @classmethod
+    def invalidate_tweet_view(cls, tweet_id):
+        MemcachedHelper.invalidate_cache(TweetView, tweet_id)
+
+    @classmethod
+    def get_photo_urls_from_names(cls, photo_names):
+        # Urls of S3 files are presigned when they are built, so they are never stored
+        return [default_storage.url(name) for name in photo_names]
+
+    @classmethod
+    def get_photo_urls(cls, tweet_ids):
+        photo_urls = {tweet_id: [] for tweet_id in tweet_ids}
+        photos = TweetPhoto.objects.filter(tweet_id__in=tweet_ids).order_by('order')
+        for photo in photos:
+            photo_urls[photo.tweet_id].append(photo.file.url)
+        return photo_urls
+
+    @classmethod
+    def hydrate_tweets(cls, tweets, user):
+        # Batch load what TweetSerializer needs for a page of tweets, either Tweet or TweetView.
+        # User cards are attached to the tweets, the other fields are returned by tweet id.
+        # Author snapshots embedded in tweet views are used while their version is current
+        user_ids = set(tweet.user_id for tweet in tweets if tweet.user_id is not None)
+        versions = UserService.get_user_card_versions(user_ids)
+        stale_tweets = []
+        for tweet in tweets:
+            user_card = getattr(tweet, 'user_card', None)
+            if user_card is not None and tweet.user_card_version == versions[tweet.user_id]:
+                tweet._cached_user = user_card
+            elif tweet.user_id is not None:
+                stale_tweets.append(tweet)
+        user_cards = UserService.get_user_cards(set(tweet.user_id for tweet in stale_tweets))
+        for tweet in stale_tweets:
+            if tweet.user_id in user_cards:
+                tweet._cached_user = user_cards[tweet.user_id]
 
+        tweet_ids = [tweet.id for tweet in tweets]
+        # Counters are keyed by model, id-only instances are enough to reach them
+        id_only_tweets = [Tweet(id=tweet_id) for tweet_id in tweet_ids]
+        likes_counts = RedisHelper.get_counts(id_only_tweets, 'likes_count')
+        comments_counts = RedisHelper.get_counts(id_only_tweets, 'comments_count')
+        liked_tweet_ids = LikeServices.get_liked_object_ids(user, Tweet, tweet_ids)
+        # Only tweet views cached before photo_names was backfilled read TweetPhoto
+        photo_urls = {
+            tweet.id: cls.get_photo_urls_from_names(tweet.photo_names)
+            for tweet in tweets
+            if tweet.photo_names is not None
+        }
+        photo_urls.update(cls.get_photo_urls([tweet.id for tweet in tweets if tweet.photo_names is None]))
+        return {
+            tweet.id: {
+                'like_count': likes_count,
+                'comments_count': comments_count,
+                'has_liked': tweet.id in liked_tweet_ids,
+                'photo_urls': photo_urls[tweet.id],
+            }
+            for tweet, likes_count, comments_count in zip(tweets, likes_counts, comments_counts)
+        }
@@ -0,0 +1,10 @@
+from celery import shared_task
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(routing_key='default', time_limit=ONE_HOUR)
+def ingest_tweet_photos_task(tweet_id):
+    from tweets.services import TweetService
+
+    uploaded = TweetService.ingest_photos(tweet_id)
+    return '{} photos uploaded.'.format(uploaded)
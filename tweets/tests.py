@@ -1,8 +1,14 @@
+from accounts.services import UserService
 from datetime import timedelta
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest import mock
 from testing.testcases import TestCase
 from utils.time_helpers import utc_now
 from utils.redis_client import RedisClient
 from utils.redis_serializers import DjangoModelSerializer
+from tweets.dtos import TweetView
+from tweets.models import Tweet, TweetPhoto
+from tweets.services import TweetRedisSerializer, TweetService
 
 
 class TweetTests(TestCase):
@@ -33,7 +39,7 @@ class TweetTests(TestCase):
 
     def test_cache_tweet_via_redis(self):
         tweet = self.create_tweet(self.zhekang)
-        conn = RedisClient.get_connection()
+        conn = RedisClient.get_connection('feeds')
         serialized_data = DjangoModelSerializer.serialize(tweet)
         conn.set('tweet:{}'.format(tweet.id), serialized_data)
         data = conn.get('tweet:random_id')
@@ -43,3 +49,70 @@ class TweetTests(TestCase):
         original_data = DjangoModelSerializer.deserialize(data)
         self.assertEqual(original_data, tweet)
 
+    def test_tweet_views(self):
+        # Tweets are encoded to compact sorted set entries and decoded without models
+        member, score = TweetRedisSerializer.serialize(self.tweet)
+        tweet_view = TweetRedisSerializer.deserialize(member, score)
+        self.assertIsInstance(tweet_view, TweetView)
+        self.assertEqual(
+            (tweet_view.id, tweet_view.user_id, tweet_view.content, tweet_view.created_at),
+            (self.tweet.id, self.zhekang.id, self.tweet.content, self.tweet.created_at),
+        )
+        self.assertEqual(TweetRedisSerializer.serialize(tweet_view), (member, score))
+
+        # Cached views are refreshed when the tweet is saved
+        self.assertEqual(TweetService.get_tweet_views([self.tweet.id])[self.tweet.id].content, self.tweet.content)
+        self.tweet.content = 'updated content'
+        self.tweet.save()
+        self.assertEqual(TweetService.get_tweet_views([self.tweet.id])[self.tweet.id].content, 'updated content')
+
+        # and evicted when it is deleted
+        tweet_id = self.tweet.id
+        self.tweet.delete()
+        self.assertEqual(TweetService.get_tweet_views([tweet_id]), {})
+
+    def test_author_snapshot(self):
+        tweet_view = TweetService.get_tweet_views([self.tweet.id])[self.tweet.id]
+        self.assertEqual(tweet_view.user_card.username, 'zhekang')
+
+        # A current snapshot is rendered without reading user cards
+        with mock.patch.object(UserService, 'get_user_cards', wraps=UserService.get_user_cards) as get_user_cards:
+            TweetService.hydrate_tweets([tweet_view], self.xiaohe)
+        get_user_cards.assert_called_once_with(set())
+        self.assertIs(tweet_view.cached_user, tweet_view.user_card)
+
+        # A profile change bumps the card version, the cached snapshot is not used anymore
+        profile = self.zhekang.profile
+        profile.nickname = 'zk'
+        profile.save()
+        tweet_view = TweetService.get_tweet_views([self.tweet.id])[self.tweet.id]
+        self.assertIsNone(tweet_view.user_card.nickname)
+        TweetService.hydrate_tweets([tweet_view], self.xiaohe)
+        self.assertEqual(tweet_view.cached_user.nickname, 'zk')
+
+    def test_photo_urls(self):
+        # Cache the tweets of zhekang before the photos are uploaded
+        TweetService.get_cached_tweets(self.zhekang.id)
+        file = SimpleUploadedFile('selfie.jpg', str.encode('a fake image'), content_type='image/jpeg')
+        TweetService.create_photos_from_files(self.tweet, [file])
+        self.assertEqual(len(self.tweet.photo_names), 1)
+        self.assertIn('selfie', self.tweet.photo_names[0])
+        photo_urls = [TweetPhoto.objects.get(tweet=self.tweet).file.url]
+
+        # The cached tweet is replaced with the one holding photo names, urls are built from
+        # them when the tweet is hydrated
+        cached_tweets = TweetService.get_cached_tweets(self.zhekang.id)
+        self.assertEqual(len(cached_tweets), 1)
+        self.assertEqual(cached_tweets[0].photo_names, self.tweet.photo_names)
+        hydrated_tweets = TweetService.hydrate_tweets([self.tweet], self.xiaohe)
+        self.assertEqual(hydrated_tweets[self.tweet.id]['photo_urls'], photo_urls)
+
+        # Tweets created before photo_names was materialized fall back to TweetPhoto
+        Tweet.objects.filter(id=self.tweet.id).update(photo_names=None)
+        legacy_tweet = Tweet.objects.get(id=self.tweet.id)
+        hydrated_tweets = TweetService.hydrate_tweets([legacy_tweet], self.xiaohe)
+        self.assertEqual(hydrated_tweets[self.tweet.id]['photo_urls'], photo_urls)
+
+        # Views cached with photo urls are decoded without them
+        tweet_view = TweetView.decode([self.tweet.id, self.zhekang.id, '', 0, None, None, ['expired url']])
+        self.assertIsNone(tweet_view.photo_names)
@@ -1,7 +1,17 @@
 # Memcached
 FOLLOWINGS_PATTERN = 'followings:{user_id}'
+FOLLOWERS_COUNT_PATTERN = 'followers_count:{user_id}'
+FOLLOWINGS_COUNT_PATTERN = 'followings_count:{user_id}'
+PULL_MODE_FOLLOWINGS_PATTERN = 'pull_mode_followings:{user_id}'
 USER_PROFILE_PATTERN = 'userprofile:{user_id}'
 
 # Redis
-USER_TWEETS_PATTERN = 'user_tweets:{user_id}'
-USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
+# Bumped whenever a user card changes, snapshots of cards taken at older versions are stale
+USER_CARD_VERSION_PATTERN = 'user_card_version:{user_id}'
+# Sorted set of encoded TweetView, renamed from the former list of JSON tweets
+USER_TWEETS_PATTERN = 'user_tweet_views:{user_id}'
+# Sorted set of compact newsfeed entries, renamed from the former list of JSON newsfeeds
+USER_NEWSFEEDS_PATTERN = 'user_newsfeed_ids:{user_id}'
+# Sorted sets of the newest comments and likes of a tweet, shown in tweet details
+TWEET_COMMENTS_PATTERN = 'tweet_comments:{tweet_id}'
+TWEET_LIKES_PATTERN = 'tweet_likes:{tweet_id}'
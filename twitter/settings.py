@@ -67,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.middlewares.RequestCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'twitter.urls'
@@ -105,6 +106,17 @@ DATABASES = {
 
 # HBase Database
 HBASE_HOST = '127.0.0.1'
+HBASE_PORT = 9090
+HBASE_POOL_SIZE = 10
+# Seconds to wait for a free connection in the pool
+HBASE_POOL_TIMEOUT = 1
+# Milliseconds, Thrift socket timeout
+HBASE_SOCKET_TIMEOUT = 1000
+# Calls failed on a broken Thrift socket are retried with exponential backoff in seconds
+HBASE_RETRIES = 2
+HBASE_RETRY_BACKOFF = 0.05
+# Seconds, calls slower than this are logged as warnings
+HBASE_SLOW_CALL_THRESHOLD = 0.1
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -152,6 +164,20 @@ AWS_S3_REGION_NAME = 'ca-central-1'
 
 MEDIA_ROOT = 'media/'
 
+# Tweet photos
+# In async mode the request only writes photos to the staging storage, which must be shared
+# with the Celery workers, e.g. a network mount. ingest_tweet_photos_task uploads them to
+# DEFAULT_FILE_STORAGE, makes their variants and publishes them
+TWEET_PHOTOS_ASYNC_UPLOAD = False
+TWEET_PHOTOS_STAGING_STORAGE = 'django.core.files.storage.FileSystemStorage'
+TWEET_PHOTOS_STAGING_OPTIONS = {'location': '/mnt/shared/tweet_photos/'}
+TWEET_PHOTOS_INGEST_WORKERS = 4
+# Resized copies stored next to each photo as <name>_<variant>.<ext>
+TWEET_PHOTO_VARIANT_SIZES = {
+    'small': (240, 240),
+    'medium': (680, 680),
+}
+
 # Memcached settings
 CACHES = {
     'default': {
@@ -179,6 +205,34 @@ REDIS_PORT = 6379
 REDIS_DB = 0 if TESTING else 1
 REDIS_KEY_EXPIRE_TIME = 7 * 86400  # in seconds
 REDIS_LIST_LENGTH_LIMIT = 1000 if not TESTING else 20
+REDIS_MAX_CONNECTIONS = 50  # per client and process
+REDIS_POOL_TIMEOUT = 1  # in seconds, to wait for a free connection
+REDIS_SOCKET_TIMEOUT = 0.5  # in seconds
+REDIS_SOCKET_CONNECT_TIMEOUT = 0.5  # in seconds
+REDIS_HEALTH_CHECK_INTERVAL = 30  # in seconds
+REDIS_REBUILD_LOCK_TIMEOUT = 3000  # in milliseconds
+REDIS_REBUILD_WAIT_RETRIES = 5
+REDIS_REBUILD_WAIT_INTERVAL = 0.05  # in seconds
+# Logical clients with their own connection pools, HOST, PORT, DB and the pool
+# settings above can be overridden per client
+REDIS_CLIENTS = {
+    'default': {},
+    'feeds': {},
+    'counters': {},
+    'ratelimit': {},
+}
+
+# Newsfeeds
+# Tweets of users with more followers than the threshold are not fanned out,
+# they are pulled from the author's cached tweets when followers read newsfeeds
+NEWSFEED_PULL_MODE_FOLLOWERS_THRESHOLD = 10000 if not TESTING else 5
+NEWSFEED_PULL_MODE_FOLLOWINGS_CACHE_TIMEOUT = 300  # in seconds
+
+# Counters
+# In write-behind mode Redis is the authority of likes_count and comments_count,
+# the deltas are flushed to DB in batch by utils.tasks.flush_count_deltas_task
+COUNTER_WRITE_BEHIND = False
+COUNT_DELTAS_FLUSH_INTERVAL = 10  # in seconds
 
 # Celery Configration Info
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/2' if not TESTING else 'redis://127.0.0.1:6379/0'
@@ -188,6 +242,8 @@ CELERY_QUEUES = (
     Queue('default', routing_key='default'),
     Queue('newsfeeds', routing_key='newsfeeds'),
 )
+CELERY_IMPORTS = ('utils.tasks',)
+CELERY_BEAT_SCHEDULE = {}
 
 # Rate Limiter
 RATELIMIT_USE_CACHE = 'ratelimit'
@@ -198,3 +254,10 @@ try:
     from .local_settings import *
 except:
     pass
+
+# Counter deltas are only recorded in write-behind mode, which local settings may turn on
+if COUNTER_WRITE_BEHIND:
+    CELERY_BEAT_SCHEDULE['flush-count-deltas'] = {
+        'task': 'utils.tasks.flush_count_deltas_task',
+        'schedule': COUNT_DELTAS_FLUSH_INTERVAL,
+    }
@@ -1,8 +1,13 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from django.conf import settings
 from django.core.cache import caches
 
 cache = caches['testing'] if settings.TESTING else caches['default']
 
+# In-process L1 in front of memcached, only enabled in the scope of a request
+_request_cache = ContextVar('request_cache', default=None)
+
 
 class MemcachedHelper:
 
@@ -11,21 +16,89 @@ class MemcachedHelper:
         key = "{}:{}".format(model_class.__name__, obj_id)
         return key
 
+    @classmethod
+    @contextmanager
+    def request_cache(cls):
+        token = _request_cache.set({})
+        try:
+            yield
+        finally:
+            _request_cache.reset(token)
+
     @classmethod
     def get_instance_via_cache(cls, model_class, obj_id):
         key = cls.get_key(model_class, obj_id)
-        instance = cache.get(key)
+        request_cache = _request_cache.get()
+        if request_cache is not None and key in request_cache:
+            return request_cache[key]
 
-        # Cache hit
-        if instance is not None:
-            return instance
+        instance = cache.get(key)
 
         # Cache missed. Returned from DB
-        instance = model_class.objects.get(id=obj_id)
-        cache.set(key, instance)
+        if instance is None:
+            instance = model_class.objects.get(id=obj_id)
+            cache.set(key, instance)
+
+        if request_cache is not None:
+            request_cache[key] = instance
         return instance
 
+    @classmethod
+    def _get_many_via_cache(cls, key_class, obj_ids, load_many, serializer=None):
+        # Objects are read from the request cache first, then from memcached with one
+        # get_many, and the rest are loaded by load_many(missed_ids), which returns them by
+        # id, and backfilled with one set_many. Memcached holds serializer.encode(obj) and
+        # serializer.decode(value) rebuilds the object, objects are cached as is without one
+        keys = {cls.get_key(key_class, obj_id): obj_id for obj_id in obj_ids}
+        request_cache = _request_cache.get()
+        if request_cache is None:
+            request_cache = {}
+        objects = {
+            obj_id: request_cache[key]
+            for key, obj_id in keys.items()
+            if key in request_cache
+        }
+
+        missed_keys = [key for key, obj_id in keys.items() if obj_id not in objects]
+        cached_values = cache.get_many(missed_keys) if missed_keys else {}
+        for key, value in cached_values.items():
+            obj = value if serializer is None else serializer.decode(value)
+            objects[keys[key]] = obj
+            request_cache[key] = obj
+
+        missed_ids = [obj_id for obj_id in keys.values() if obj_id not in objects]
+        if not missed_ids:
+            return objects
+        missed_values = {}
+        for obj_id, obj in load_many(missed_ids).items():
+            key = cls.get_key(key_class, obj_id)
+            missed_values[key] = obj if serializer is None else serializer.encode(obj)
+            objects[keys[key]] = obj
+            request_cache[key] = obj
+        cache.set_many(missed_values)
+        return objects
+
+    @classmethod
+    def get_instances_via_cache(cls, model_class, obj_ids):
+        return cls._get_many_via_cache(
+            model_class,
+            obj_ids,
+            lambda missed_ids: {
+                instance.id: instance
+                for instance in model_class.objects.filter(id__in=missed_ids)
+            },
+        )
+
+    @classmethod
+    def get_dtos_via_cache(cls, dto_class, obj_ids):
+        # __slots__ read models are cached as the tuples of dto.encode() and built by
+        # dto_class.load_many(obj_ids) on cache miss
+        return cls._get_many_via_cache(dto_class, obj_ids, dto_class.load_many, serializer=dto_class)
+
     @classmethod
     def invalidate_cache(cls, model_class, obj_id):
         key = cls.get_key(model_class, obj_id)
         cache.delete(key)
+        request_cache = _request_cache.get()
+        if request_cache is not None:
+            request_cache.pop(key, None)
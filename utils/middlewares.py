@@ -0,0 +1,13 @@
+from utils.memcached_helper import MemcachedHelper
+
+
+class RequestCacheMiddleware:
+    # Objects read via MemcachedHelper are kept in process until the response is returned,
+    # so a page with many tweets of one author does not fetch the author from memcached repeatedly
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with MemcachedHelper.request_cache():
+            return self.get_response(request)
@@ -1,78 +1,127 @@
+import base64
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import BasePagination
 from rest_framework.response import Response
 from dateutil import parser
-from django.conf import settings
+from django.db.models import Q
+from utils.time_helpers import datetime_to_timestamp_us, timestamp_us_to_datetime
 
 
 class EndlessPagination(BasePagination):
     page_size = 20
+    cursor_query_param = 'cursor'
 
     def __init__(self):
         super(EndlessPagination, self).__init__()
         self.has_next_page = False
+        self.next_cursor = None
 
     def to_html(self):
         pass
 
+    @classmethod
+    def get_sort_key(cls, obj):
+        # Items are ordered by (created_at, id) desc, id breaks ties of created_at.
+        # Entries which are not saved in DB, e.g. pulled newsfeeds, have no id
+        return datetime_to_timestamp_us(obj.created_at), obj.id or 0
+
+    @classmethod
+    def encode_cursor(cls, obj):
+        cursor = '{}.{}'.format(*cls.get_sort_key(obj))
+        return base64.urlsafe_b64encode(cursor.encode('ascii')).decode('ascii')
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        try:
+            timestamp_us, obj_id = base64.urlsafe_b64decode(cursor.encode('ascii')).split(b'.')
+            return int(timestamp_us), int(obj_id)
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise NotFound('Invalid cursor')
+
+    @classmethod
+    def filter_range(cls, queryset, below=None, above=None):
+        # Keyset filter of the objects whose sort key is less than `below` and whose
+        # created_at in microseconds is greater than `above`, ordered by sort key desc
+        if below is not None:
+            created_at, obj_id = timestamp_us_to_datetime(below[0]), below[1]
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=obj_id))
+        if above is not None:
+            queryset = queryset.filter(created_at__gt=timestamp_us_to_datetime(above))
+        return queryset.order_by('-created_at', '-id')
+
+    def get_start_key(self, request):
+        # Sort key the requested page starts below, None for the first page
+        if request.query_params.get(self.cursor_query_param):
+            return self.decode_cursor(request.query_params[self.cursor_query_param])
+        if 'created_at__lt' in request.query_params:
+            created_at__lt = parser.isoparse(request.query_params['created_at__lt'])
+            return datetime_to_timestamp_us(created_at__lt), 0
+        return None
+
+    def set_next_page(self, has_next_page, page):
+        self.has_next_page = has_next_page
+        self.next_cursor = self.encode_cursor(page[-1]) if has_next_page else None
+
     def paginate_queryset(self, queryset, request, view=None):
         # Extract the most recent posts. Pagination does not apply when loading the newest data
         if 'created_at__gt' in request.query_params:
             created_at__gt = request.query_params['created_at__gt']
             queryset = queryset.filter(created_at__gt=created_at__gt)
-            self.has_next_page = False
-            return queryset.order_by('-created_at')
+            self.set_next_page(False, None)
+            return queryset.order_by('-created_at', '-id')
 
         # Load all earlier posts with pagination
-        if 'created_at__lt' in request.query_params:
-            created_at__lt = request.query_params['created_at__lt']
-            queryset = queryset.filter(created_at__lt=created_at__lt)
-        queryset = queryset.order_by('-created_at')[:self.page_size + 1]
-        self.has_next_page = len(queryset) > self.page_size
-        return queryset[:self.page_size]
-
-    def paginate_ordered_list(self, reversed_ordered_list, request):
-        # Load all newest items for swiping down
+        queryset = list(self.filter_range(queryset, below=self.get_start_key(request))[:self.page_size + 1])
+        page = queryset[:self.page_size]
+        self.set_next_page(len(queryset) > self.page_size, page)
+        return page
+
+    def paginate_range(self, load_range, request):
+        # load_range(below=None, above=None, count=None) returns the objects in range wherever
+        # they are read from. Only page_size + 1 objects are loaded for a page
         if 'created_at__gt' in request.query_params:
             created_at__gt = parser.isoparse(request.query_params['created_at__gt'])
-            objects = []
-            for obj in reversed_ordered_list:
-                if obj.created_at <= created_at__gt:
-                    break
-                objects.append(obj)
-            self.has_next_page = False
-            return objects
-
-        # Earlier items are limited by page_size
-        if 'created_at__lt' in request.query_params:
-            created_at__lt = parser.isoparse(request.query_params['created_at__lt'])
-            index = 0
-            for ind, obj in enumerate(reversed_ordered_list):
-                if obj.created_at < created_at__lt:
-                    index = ind
-                    break
-            else:
-                reversed_ordered_list = []
-            self.has_next_page = len(reversed_ordered_list[index:]) > self.page_size
-            return reversed_ordered_list[index: index + self.page_size]
-
-    def paginate_cached_list(self, cached_list, request):
-        paginated_list = self.paginate_ordered_list(cached_list, request)
-
+            self.set_next_page(False, None)
+            return load_range(above=datetime_to_timestamp_us(created_at__gt))
+
+        objects = load_range(below=self.get_start_key(request), count=self.page_size + 1)
+        page = objects[:self.page_size]
+        self.set_next_page(len(objects) > self.page_size, page)
+        return page
+
+    def paginate_cached_range(self, load_range, request):
+        # load_range(below=None, above=None, count=None) reads a range of a cached sorted set
+        # and returns it with whether the cache holds every object, see
+        # RedisHelper.load_sorted_objects_range.
+        # Only page_size + 1 items are read from the cache for a page
         if 'created_at__gt' in request.query_params:
-            return paginated_list
-
-        if self.has_next_page:
-            return paginated_list
+            created_at__gt = parser.isoparse(request.query_params['created_at__gt'])
+            objects, _ = load_range(above=datetime_to_timestamp_us(created_at__gt))
+            self.set_next_page(False, None)
+            return objects
 
-        if len(cached_list) < settings.REDIS_LIST_LENGTH_LIMIT:
-            return paginated_list
+        objects, complete = load_range(below=self.get_start_key(request), count=self.page_size + 1)
+        page = objects[:self.page_size]
+        self.set_next_page(len(objects) > self.page_size, page)
+        if self.has_next_page or complete:
+            return page
 
+        # The cache is exhausted while DB may have more
         return None
 
+    def paginate_cached_first_page(self, load_range, queryset):
+        # First page of a cached sorted set regardless of the query params, e.g. a preview
+        # embedded in another response. next_cursor continues on the paginated endpoint
+        objects, complete = load_range(count=self.page_size + 1)
+        if len(objects) <= self.page_size and not complete:
+            objects = list(queryset.order_by('-created_at', '-id')[:self.page_size + 1])
+        page = objects[:self.page_size]
+        self.set_next_page(len(objects) > self.page_size, page)
+        return page
+
     def get_paginated_response(self, data):
         return Response({
             'has_next_page': self.has_next_page,
+            'next_cursor': self.next_cursor,
             'results': data,
         })
-
-
@@ -1,29 +1,70 @@
 from django.conf import settings
 import redis
+import threading
 
 
 class RedisClient:
-    conn = None
+    # One pool per logical client, so that slow feed reads can not exhaust the
+    # connections used by counters. redis-py pools are thread-safe and reset
+    # themselves in a forked child process, e.g. a Celery prefork worker
+    conns = {}
+    lock = threading.Lock()
 
     @classmethod
-    def get_connection(cls):
-        if cls.conn:
-            return cls.conn
+    def get_config(cls, name):
+        config = {
+            'HOST': settings.REDIS_HOST,
+            'PORT': settings.REDIS_PORT,
+            'DB': settings.REDIS_DB,
+            'MAX_CONNECTIONS': settings.REDIS_MAX_CONNECTIONS,
+            'POOL_TIMEOUT': settings.REDIS_POOL_TIMEOUT,
+            'SOCKET_TIMEOUT': settings.REDIS_SOCKET_TIMEOUT,
+            'SOCKET_CONNECT_TIMEOUT': settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            'HEALTH_CHECK_INTERVAL': settings.REDIS_HEALTH_CHECK_INTERVAL,
+        }
+        if name not in settings.REDIS_CLIENTS:
+            raise Exception("Redis client {} is not configured!".format(name))
+        config.update(settings.REDIS_CLIENTS[name])
+        return config
 
-        # Set connection with Redis server
-        cls.conn = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=settings.REDIS_DB,
+    @classmethod
+    def _create_connection(cls, name):
+        config = cls.get_config(name)
+        # Callers wait for a free connection instead of failing when the pool is full
+        pool = redis.BlockingConnectionPool(
+            host=config['HOST'],
+            port=config['PORT'],
+            db=config['DB'],
+            max_connections=config['MAX_CONNECTIONS'],
+            timeout=config['POOL_TIMEOUT'],
+            socket_timeout=config['SOCKET_TIMEOUT'],
+            socket_connect_timeout=config['SOCKET_CONNECT_TIMEOUT'],
+            health_check_interval=config['HEALTH_CHECK_INTERVAL'],
         )
+        return redis.Redis(connection_pool=pool)
+
+    @classmethod
+    def get_connection(cls, name='default'):
+        conn = cls.conns.get(name)
+        if conn:
+            return conn
 
-        return cls.conn
+        # Set connection with Redis server
+        with cls.lock:
+            if name not in cls.conns:
+                cls.conns[name] = cls._create_connection(name)
+        return cls.conns[name]
 
     @classmethod
     def clear(cls):
         # Clear all keys in Redis for testing environment only
         if not settings.TESTING:
             raise Exception("You are not allowed to flush redis cache in Prod environment!")
-        conn = cls.get_connection()
-        conn.flushdb()
-
+        flushed = set()
+        for name in settings.REDIS_CLIENTS:
+            config = cls.get_config(name)
+            location = (config['HOST'], config['PORT'], config['DB'])
+            if location in flushed:
+                continue
+            cls.get_connection(name).flushdb()
+            flushed.add(location)
@@ -1,87 +1,511 @@
-from utils.redis_serializers import DjangoModelSerializer
-from utils.redis_client import RedisClient
+import time
+import uuid
+from collections import defaultdict
+from django.apps import apps
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from utils.redis_serializers import LazyDeserializedList
+from utils.redis_client import RedisClient
+
+# Hash keys holding counter deltas not flushed to DB yet, used in write-behind mode
+COUNT_DELTAS_PATTERN = 'count_deltas:{label}.{attr}'
+COUNT_DELTAS_REGISTRY_KEY = 'count_deltas'
+# Hash keys tracking the changes of a counter made to DB, expired shortly after the last one
+COUNT_WRITES_EXPIRE_TIME = 60  # in seconds
+# Only the holder of the lock rebuilds a missed key from DB
+REBUILD_LOCK_PATTERN = 'rebuild_lock:{key}'
+
+# Delete the lock only when it is still held by the caller
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# A sorted set trimmed to the length limit holds this member, scored below every object,
+# so that it is told apart from a sorted set holding every object once objects are removed
+TRUNCATED_MEMBER = b''
+TRUNCATED_SCORE = 0
+
+# Keep the newest members up to the length limit and mark the sorted set as truncated when
+# older ones are dropped. The marker is the lowest member, it is added back when trimmed
+TRIM_FUNCTION = """
+local function trim(key, limit)
+    if redis.call('ZREMRANGEBYRANK', key, 0, -limit - 1) > 0 then
+        redis.call('ZADD', key, 0, '')
+    end
+end
+"""
+
+# ZADD and trim to the length limit
+PUSH_SCRIPT = TRIM_FUNCTION + """
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+trim(KEYS[1], tonumber(ARGV[3]))
+"""
+
+# ZADD and trim to the length limit only when the sorted set is cached
+PUSH_IF_EXISTS_SCRIPT = TRIM_FUNCTION + """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+    trim(KEYS[1], tonumber(ARGV[3]))
+end
+"""
+
+# Replace the members of the same id at the score, only when the object is in the sorted set
+REPLACE_IF_EXISTS_SCRIPT = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])
+local replaced = 0
+for _, member in ipairs(members) do
+    if string.sub(member, 1, string.len(ARGV[2])) == ARGV[2] then
+        redis.call('ZREM', KEYS[1], member)
+        replaced = 1
+    end
+end
+if replaced == 1 then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[3])
+end
+return replaced
+"""
+
+# Remove the members of the same id at the score. A truncated sorted set keeps its marker,
+# so it is still known to miss objects which are only in DB
+REMOVE_SCRIPT = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])
+local removed = 0
+for _, member in ipairs(members) do
+    if string.sub(member, 1, string.len(ARGV[2])) == ARGV[2] then
+        removed = removed + redis.call('ZREM', KEYS[1], member)
+    end
+end
+return removed
+"""
+
+# Finish a change of the counter in DB started by _begin_count_write, then INCRBY
+# when the counter is cached, returns nil otherwise
+INCR_IF_EXISTS_SCRIPT = """
+redis.call('HINCRBY', KEYS[2], 'inflight', -1)
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return nil
+"""
+
+# Record the delta to be flushed to DB, then INCRBY when the counter is cached
+INCR_WITH_DELTA_SCRIPT = """
+redis.call('HINCRBY', KEYS[2], ARGV[2], ARGV[1])
+redis.call('SADD', KEYS[3], KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return nil
+"""
+
+# Version of the changes to the counter in DB. The count of changes started and of the ones
+# still in flight in write-through mode, the writes hash expires shortly after the last one.
+# The generation of the last deltas renamed away by a flush in write-behind mode
+COUNT_VERSION_FUNCTION = """
+local function get_version()
+    local writes = redis.call('HMGET', KEYS[2], 'started', 'inflight')
+    return {writes[1] or '0', writes[2] or '0', redis.call('GET', KEYS[5]) or '0'}
+end
+"""
+
+# First step of the initialization of a counter, run before DB is read. The deltas being
+# flushed are returned with their generation, DB includes them once the row has reached it
+BEGIN_INIT_COUNT_SCRIPT = COUNT_VERSION_FUNCTION + """
+local flushing = redis.call('HMGET', KEYS[4], 'generation', ARGV[1])
+return {table.concat(get_version(), ':'), tonumber(flushing[1]) or 0, tonumber(flushing[2]) or 0}
+"""
+
+# Second step, run after DB is read. The counter is initialized from its DB value plus the
+# deltas not in DB yet, only when the DB value is certain to include every change made
+# before and none made after: no change was in flight, and none started and no deltas were
+# renamed away since the first step. Otherwise the count is returned without caching it.
+# A counter initialized concurrently by another process is returned as is
+INIT_COUNT_SCRIPT = COUNT_VERSION_FUNCTION + """
+local count = redis.call('GET', KEYS[1])
+if count then
+    return tonumber(count)
+end
+count = tonumber(ARGV[1]) + tonumber(ARGV[3]) + (tonumber(redis.call('HGET', KEYS[3], ARGV[2])) or 0)
+local version = get_version()
+if version[2] == '0' and table.concat(version, ':') == ARGV[4] then
+    redis.call('SET', KEYS[1], count, 'EX', ARGV[5])
+end
+return count
+"""
+
+# Rename the deltas away to be flushed under a new generation, which is greater than the
+# previous one even if Redis lost it. Deltas left by an interrupted flush are flushed again
+# under their own generation before new ones are taken
+BEGIN_FLUSH_SCRIPT = """
+local generation = redis.call('HGET', KEYS[2], 'generation')
+if generation then
+    return tonumber(generation)
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+generation = math.max(tonumber(ARGV[1]), (tonumber(redis.call('GET', KEYS[3])) or 0) + 1)
+redis.call('SET', KEYS[3], generation)
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('HSET', KEYS[2], 'generation', generation)
+return generation
+"""
 
 
 class RedisHelper:
 
     @classmethod
-    def _load_objects_to_cache(cls, key, objects):
-        conn = RedisClient.get_connection()
+    def _acquire_rebuild_lock(cls, conn, key):
+        token = uuid.uuid4().hex
+        lock_key = REBUILD_LOCK_PATTERN.format(key=key)
+        if conn.set(lock_key, token, nx=True, px=settings.REDIS_REBUILD_LOCK_TIMEOUT):
+            return token
+        return None
 
-        serialized_list = []
-        for obj in objects:
-            serialized_data = DjangoModelSerializer.serialize(obj)
-            serialized_list.append(serialized_data)
+    @classmethod
+    def _release_rebuild_lock(cls, conn, key, token):
+        release_lock = conn.register_script(RELEASE_LOCK_SCRIPT)
+        release_lock(keys=[REBUILD_LOCK_PATTERN.format(key=key)], args=[token])
 
-        if serialized_list:
-            conn.rpush(key, *serialized_list)
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+    @classmethod
+    def _wait_for_rebuild(cls, conn, key):
+        # Give the process holding the lock a moment to put the key in place
+        for _ in range(settings.REDIS_REBUILD_WAIT_RETRIES):
+            time.sleep(settings.REDIS_REBUILD_WAIT_INTERVAL)
+            if conn.exists(key):
+                return True
+        return False
 
     @classmethod
-    def load_objects(cls, key, queryset):
-        conn = RedisClient.get_connection()
+    def _replace_key(cls, conn, key, fill):
+        # Build the new value under a temporary key and rename it into place, so
+        # readers never see a partially loaded or duplicated key
+        tmp_key = '{}:rebuilding'.format(key)
+        pipe = conn.pipeline()
+        pipe.delete(tmp_key)
+        fill(pipe, tmp_key)
+        pipe.expire(tmp_key, settings.REDIS_KEY_EXPIRE_TIME)
+        pipe.rename(tmp_key, key)
+        pipe.execute()
+
+    @classmethod
+    def _load_sorted_objects_to_cache(cls, key, objects, serializer):
+        conn = RedisClient.get_connection('feeds')
+
+        objects = list(objects)
+        mapping = dict(serializer.serialize_many(objects))
+        # Objects are loaded up to the length limit, DB may hold older ones
+        if len(objects) >= settings.REDIS_LIST_LENGTH_LIMIT:
+            mapping[TRUNCATED_MEMBER] = TRUNCATED_SCORE
+
+        if mapping:
+            cls._replace_key(conn, key, lambda pipe, tmp_key: pipe.zadd(tmp_key, mapping))
+
+    @classmethod
+    def _get_cached_sorted_objects(cls, conn, key, serializer):
+        entries = conn.zrevrangebyscore(key, '+inf', '({}'.format(TRUNCATED_SCORE), withscores=True)
+        return LazyDeserializedList(entries, lambda entry: serializer.deserialize(*entry))
+
+    @classmethod
+    def load_sorted_objects(cls, key, queryset, serializer):
+        # Objects are returned by score desc, missed keys are rebuilt single-flight
+        conn = RedisClient.get_connection('feeds')
 
         if conn.exists(key):
-            serialized_list = conn.lrange(key, 0, -1)
-            objects = []
-            for serialized_data in serialized_list:
-                obj = DjangoModelSerializer.deserialize(serialized_data)
-                objects.append(obj)
-            return objects
+            return cls._get_cached_sorted_objects(conn, key, serializer)
+
+        token = cls._acquire_rebuild_lock(conn, key)
+        if token is None:
+            if cls._wait_for_rebuild(conn, key):
+                return cls._get_cached_sorted_objects(conn, key, serializer)
+            return list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
 
-        cls._load_objects_to_cache(key, queryset)
-        return list(queryset)
+        try:
+            objects = list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
+            cls._load_sorted_objects_to_cache(key, objects, serializer)
+        finally:
+            cls._release_rebuild_lock(conn, key, token)
+        return objects
 
     @classmethod
-    def push_single_object(cls, key, obj, queryset):
-        conn = RedisClient.get_connection()
+    def _get_cached_sorted_range(cls, conn, key, serializer, below, above, count):
+        # One round trip checks whether the sorted set is cached and truncated, and reads the
+        # entries tied with the score of `below`, whose ids decide if they are in range, and
+        # the window under it
+        pipe = conn.pipeline(transaction=False)
+        pipe.exists(key)
+        pipe.zscore(key, TRUNCATED_MEMBER)
+        max_score = '+inf'
+        if below is not None:
+            pipe.zrevrangebyscore(key, below[0], below[0], withscores=True)
+            max_score = '({}'.format(below[0])
+        min_score = '({}'.format(TRUNCATED_SCORE if above is None else max(above, TRUNCATED_SCORE))
+        if count is None:
+            pipe.zrevrangebyscore(key, max_score, min_score, withscores=True)
+        else:
+            pipe.zrevrangebyscore(key, max_score, min_score, start=0, num=count, withscores=True)
+        results = pipe.execute()
+        if not results[0]:
+            return None, False
 
-        # Key does not exist
+        objects = []
+        if below is not None:
+            tied_objects = [serializer.deserialize(member, score) for member, score in results[2]]
+            objects = [obj for obj in tied_objects if obj.id < below[1]]
+        objects.extend(serializer.deserialize(member, score) for member, score in results[-1])
+        return objects[:count], results[1] is None
+
+    @classmethod
+    def load_sorted_objects_range(cls, key, queryset, serializer, below=None, above=None, count=None):
+        # Objects ordered by (score, id) desc whose sort key is less than `below` and whose
+        # score is greater than `above`, at most `count` of them. Only the range is read and
+        # deserialized. Whether the cache holds every object is returned as well, callers
+        # read DB for the objects beyond a cache which does not
+        conn = RedisClient.get_connection('feeds')
+        objects, complete = cls._get_cached_sorted_range(conn, key, serializer, below, above, count)
+        if objects is not None:
+            return objects, complete
+
+        objects = cls.load_sorted_objects(key, queryset, serializer)
+        objects_in_range = [
+            obj for obj in objects
+            if (below is None or serializer.get_sort_key(obj) < tuple(below))
+            and (above is None or serializer.get_score(obj) > above)
+        ]
+        return objects_in_range[:count], len(objects) < settings.REDIS_LIST_LENGTH_LIMIT
+
+    @classmethod
+    def push_single_sorted_object(cls, key, obj, queryset, serializer):
+        conn = RedisClient.get_connection('feeds')
+
+        # Key does not exist, it is loaded from DB unless another process is doing so
         if not conn.exists(key):
-            cls._load_objects_to_cache(key, queryset)
+            token = cls._acquire_rebuild_lock(conn, key)
+            if token is None:
+                return
+            try:
+                cls._load_sorted_objects_to_cache(key, queryset[:settings.REDIS_LIST_LENGTH_LIMIT], serializer)
+            finally:
+                cls._release_rebuild_lock(conn, key, token)
             return
-        # Key exists
-        serialized_object = DjangoModelSerializer.serialize(obj)
-        conn.lpush(key, serialized_object)
-        conn.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
+        # Key exists, keep the newest REDIS_LIST_LENGTH_LIMIT entries
+        member, score = serializer.serialize(obj)
+        push = conn.register_script(PUSH_SCRIPT)
+        push(keys=[key], args=[member, score, settings.REDIS_LIST_LENGTH_LIMIT])
+
+    @classmethod
+    def update_sorted_object(cls, key, obj, serializer):
+        # Members hold the object itself, so a changed object gets a new member which
+        # replaces the old one. Objects that are not cached are left to the next load
+        conn = RedisClient.get_connection('feeds')
+        member, score = serializer.serialize(obj)
+        replace_if_exists = conn.register_script(REPLACE_IF_EXISTS_SCRIPT)
+        replace_if_exists(keys=[key], args=[score, serializer.id_struct.pack(obj.id), member])
+
+    @classmethod
+    def remove_sorted_object(cls, key, obj, serializer):
+        conn = RedisClient.get_connection('feeds')
+        remove = conn.register_script(REMOVE_SCRIPT)
+        remove(keys=[key], args=[serializer.get_score(obj), serializer.id_struct.pack(obj.id)])
+
+    @classmethod
+    def push_objects_to_cached_sorted_sets(cls, keyed_objects, serializer):
+        # Push each object to its own sorted set in one pipeline. Sorted sets that are
+        # not cached are skipped, they are loaded from DB on the next read
+        conn = RedisClient.get_connection('feeds')
+        push_if_exists = conn.register_script(PUSH_IF_EXISTS_SCRIPT)
+        pipe = conn.pipeline(transaction=False)
+        for key, obj in keyed_objects:
+            member, score = serializer.serialize(obj)
+            push_if_exists(
+                keys=[key],
+                args=[member, score, settings.REDIS_LIST_LENGTH_LIMIT],
+                client=pipe,
+            )
+        pipe.execute()
 
     @classmethod
     def get_count_key(cls, obj, attr):
         return "{}.{}:{}".format(obj.__class__.__name__, attr, obj.id)
 
     @classmethod
-    def incr_count(cls, obj, attr):
-        conn = RedisClient.get_connection()
+    def get_count_deltas_key(cls, model_class, attr):
+        return COUNT_DELTAS_PATTERN.format(label=model_class._meta.label, attr=attr)
+
+    @classmethod
+    def get_flushing_key(cls, deltas_key):
+        return '{}:flushing'.format(deltas_key)
+
+    @classmethod
+    def get_generation_key(cls, deltas_key):
+        return '{}:generation'.format(deltas_key)
+
+    @classmethod
+    def get_generation_attr(cls, attr):
+        return '{}_generation'.format(attr)
+
+    @classmethod
+    def get_count_writes_key(cls, key):
+        return '{}:writes'.format(key)
+
+    @classmethod
+    def _init_count_keys(cls, key, obj, attr):
+        deltas_key = cls.get_count_deltas_key(obj.__class__, attr)
+        return [
+            key,
+            cls.get_count_writes_key(key),
+            deltas_key,
+            cls.get_flushing_key(deltas_key),
+            cls.get_generation_key(deltas_key),
+        ]
+
+    @classmethod
+    def _init_counts(cls, conn, keys, objs, attr):
+        # The version of the writes is read before DB, so that the counters are cached only
+        # when no change made to DB around the read can be counted twice or missed
+        model_class = objs[0].__class__
+        begin_init_count = conn.register_script(BEGIN_INIT_COUNT_SCRIPT)
+        pipe = conn.pipeline(transaction=False)
+        for key, obj in zip(keys, objs):
+            begin_init_count(keys=cls._init_count_keys(key, obj, attr), args=[obj.id], client=pipe)
+        results = pipe.execute()
+
+        # In write-behind mode the DB value misses the deltas waiting to be flushed, and
+        # includes the ones being flushed once the row has reached their generation.
+        # Otherwise it already includes every finished change
+        rows = model_class.objects.filter(id__in=[obj.id for obj in objs]) \
+            .values_list('id', attr, cls.get_generation_attr(attr))
+        db_counts = {obj_id: (count or 0, generation) for obj_id, count, generation in rows}
+        init_count = conn.register_script(INIT_COUNT_SCRIPT)
+        pipe = conn.pipeline(transaction=False)
+        for key, obj, (version, flushing_generation, flushing_delta) in zip(keys, objs, results):
+            db_count, generation = db_counts.get(obj.id, (0, 0))
+            if generation >= flushing_generation:
+                flushing_delta = 0
+            init_count(
+                keys=cls._init_count_keys(key, obj, attr),
+                args=[db_count, obj.id, flushing_delta, version, settings.REDIS_KEY_EXPIRE_TIME],
+                client=pipe,
+            )
+        return pipe.execute()
+
+    @classmethod
+    def _begin_count_write(cls, conn, writes_key):
+        pipe = conn.pipeline()
+        pipe.hincrby(writes_key, 'started', 1)
+        pipe.hincrby(writes_key, 'inflight', 1)
+        pipe.expire(writes_key, COUNT_WRITES_EXPIRE_TIME)
+        pipe.execute()
+
+    @classmethod
+    def _change_count(cls, obj, attr, delta):
+        # The counter is changed in DB as well unless in write-behind mode. Write-behind takes
+        # one Redis round trip. Write-through takes two, one on each side of the DB update, so
+        # that a cold counter is never initialized from a DB value the change may be missing from
+        conn = RedisClient.get_connection('counters')
         key = cls.get_count_key(obj, attr)
-        if not conn.exists(key):
-            obj.refresh_from_db()
-            conn.set(key, getattr(obj, attr))
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
-            return getattr(obj, attr)
-        return conn.incr(key)
+        if settings.COUNTER_WRITE_BEHIND:
+            incr_with_delta = conn.register_script(INCR_WITH_DELTA_SCRIPT)
+            count = incr_with_delta(
+                keys=[key, cls.get_count_deltas_key(obj.__class__, attr), COUNT_DELTAS_REGISTRY_KEY],
+                args=[delta, obj.id],
+            )
+        else:
+            writes_key = cls.get_count_writes_key(key)
+            cls._begin_count_write(conn, writes_key)
+            try:
+                obj.__class__.objects.filter(id=obj.id).update(**{attr: F(attr) + delta})
+            except Exception:
+                conn.hincrby(writes_key, 'inflight', -1)
+                raise
+            incr_if_exists = conn.register_script(INCR_IF_EXISTS_SCRIPT)
+            count = incr_if_exists(keys=[key, writes_key], args=[delta, COUNT_WRITES_EXPIRE_TIME])
+        if count is not None:
+            return count
+        return cls._init_counts(conn, [key], [obj], attr)[0]
+
+    @classmethod
+    def incr_count(cls, obj, attr):
+        return cls._change_count(obj, attr, 1)
 
     @classmethod
     def decr_count(cls, obj, attr):
-        conn = RedisClient.get_connection()
-        key = cls.get_count_key(obj, attr)
-        if not conn.exists(key):
-            obj.refresh_from_db()
-            conn.set(key, getattr(obj, attr))
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
-            return getattr(obj, attr)
-        return conn.decr(key)
+        return cls._change_count(obj, attr, -1)
 
     @classmethod
     def get_count(cls, obj, attr):
-        conn = RedisClient.get_connection()
+        conn = RedisClient.get_connection('counters')
         key = cls.get_count_key(obj, attr)
         count = conn.get(key)
         if count is not None:
             return int(count)
-        obj.refresh_from_db()
-        count = getattr(obj, attr)
-        conn.set(key, count)
-        return count
+        return cls._init_counts(conn, [key], [obj], attr)[0]
+
+    @classmethod
+    def get_counts(cls, objs, attr):
+        # Read all counts with one MGET and backfill the missed ones from DB in one query
+        if not objs:
+            return []
+        conn = RedisClient.get_connection('counters')
+        keys = [cls.get_count_key(obj, attr) for obj in objs]
+        counts = [None if count is None else int(count) for count in conn.mget(keys)]
+
+        missed_indexes = [index for index, count in enumerate(counts) if count is None]
+        if not missed_indexes:
+            return counts
+        missed_counts = cls._init_counts(
+            conn,
+            [keys[index] for index in missed_indexes],
+            [objs[index] for index in missed_indexes],
+            attr,
+        )
+        for index, count in zip(missed_indexes, missed_counts):
+            counts[index] = count
+        return counts
 
+    @classmethod
+    def _apply_count_deltas(cls, deltas_key, generation, deltas):
+        # Rows sharing the same delta are updated by one UPDATE ... WHERE id IN (...). The
+        # generation is written with the deltas, so rows reached by an interrupted flush of
+        # the same deltas are skipped and the deltas are applied once
+        label, attr = deltas_key.split(':', 1)[1].rsplit('.', 1)
+        model_class = apps.get_model(label)
+        generation_attr = cls.get_generation_attr(attr)
+        ids_by_delta = defaultdict(list)
+        for obj_id, delta in deltas.items():
+            if int(delta):
+                ids_by_delta[int(delta)].append(int(obj_id))
+        with transaction.atomic():
+            for delta, ids in ids_by_delta.items():
+                model_class.objects \
+                    .filter(id__in=ids, **{'{}__lt'.format(generation_attr): generation}) \
+                    .update(**{attr: F(attr) + delta, generation_attr: generation})
 
+    @classmethod
+    def flush_count_deltas(cls):
+        # The deltas are renamed away before being applied so that new changes keep
+        # accumulating in a fresh hash while the flush is running. The renamed hash is
+        # deleted only once its deltas are in DB
+        conn = RedisClient.get_connection('counters')
+        begin_flush = conn.register_script(BEGIN_FLUSH_SCRIPT)
+        flushed = 0
+        for deltas_key in conn.smembers(COUNT_DELTAS_REGISTRY_KEY):
+            deltas_key = deltas_key.decode('utf-8')
+            flushing_key = cls.get_flushing_key(deltas_key)
+            generation = begin_flush(
+                keys=[deltas_key, flushing_key, cls.get_generation_key(deltas_key)],
+                args=[int(time.time() * 1000)],
+            )
+            if generation is None:
+                continue
+            deltas = conn.hgetall(flushing_key)
+            deltas.pop(b'generation', None)
+            cls._apply_count_deltas(deltas_key, generation, deltas)
+            conn.delete(flushing_key)
+            flushed += len(deltas)
+        return flushed
@@ -1,5 +1,9 @@
+from collections.abc import Sequence
 from django.core import serializers
 from utils.json_encoder import JSONEncoder
+from utils.time_helpers import datetime_to_timestamp_us, timestamp_us_to_datetime
+import json
+import struct
 
 
 # Serialize and deserialize data for Redis read/write, connected by JSON format
@@ -12,3 +16,108 @@ class DjangoModelSerializer:
     @classmethod
     def deserialize(cls, serialized_data):
         return list(serializers.deserialize('json', serialized_data))[0].object
+
+
+# Sorted set entries are scored by created_at in microseconds, entries with the same
+# score are ordered by their members, which start with the big-endian packed id
+class SortedSetSerializer:
+    id_struct = struct.Struct('>Q')
+
+    @classmethod
+    def get_score(cls, instance):
+        return datetime_to_timestamp_us(instance.created_at)
+
+    @classmethod
+    def get_sort_key(cls, instance):
+        return cls.get_score(instance), instance.id
+
+    @classmethod
+    def serialize_many(cls, instances):
+        return [cls.serialize(instance) for instance in instances]
+
+
+# Serialize instance to a sorted set entry holding the whole instance in JSON
+class DjangoModelSortedSetSerializer(SortedSetSerializer):
+
+    @classmethod
+    def serialize(cls, instance):
+        member = cls.id_struct.pack(instance.id) + DjangoModelSerializer.serialize(instance).encode('utf-8')
+        return member, cls.get_score(instance)
+
+    @classmethod
+    def deserialize(cls, member, score):
+        return DjangoModelSerializer.deserialize(member[cls.id_struct.size:])
+
+
+# Serialize instance to a sorted set entry holding the JSON of dto_class.encode(), and
+# decode the entry to dto_class without building a model instance
+class DTOSortedSetSerializer(SortedSetSerializer):
+    dto_class = None
+
+    @classmethod
+    def serialize(cls, instance):
+        if not isinstance(instance, cls.dto_class):
+            instance = cls.dto_class.from_model(instance)
+        member = cls.id_struct.pack(instance.id) + json.dumps(instance.encode()).encode('utf-8')
+        return member, cls.get_score(instance)
+
+    @classmethod
+    def serialize_many(cls, instances):
+        # Models are converted to read models in batch
+        instances = list(instances)
+        models = [instance for instance in instances if not isinstance(instance, cls.dto_class)]
+        dtos = iter(cls.dto_class.from_models(models) if models else [])
+        return [
+            cls.serialize(instance if isinstance(instance, cls.dto_class) else next(dtos))
+            for instance in instances
+        ]
+
+    @classmethod
+    def deserialize(cls, member, score):
+        return cls.dto_class.decode(json.loads(member[cls.id_struct.size:]))
+
+
+# Serialize instance to a sorted set entry for Redis. Only (id, foreign key id) are packed
+# into a 16 bytes member, so entries are decoded without model metadata or Django deserializer
+class CompactModelSerializer(SortedSetSerializer):
+    model_class = None
+    foreign_key = None
+    member_struct = struct.Struct('>QQ')
+
+    @classmethod
+    def serialize(cls, instance):
+        # Foreign key set to NULL is packed as 0
+        foreign_id = getattr(instance, cls.foreign_key) or 0
+        member = cls.member_struct.pack(instance.id, foreign_id)
+        return member, cls.get_score(instance)
+
+    @classmethod
+    def deserialize(cls, member, score):
+        obj_id, foreign_id = cls.member_struct.unpack(member)
+        return cls.model_class(**{
+            'id': obj_id,
+            cls.foreign_key: foreign_id or None,
+            'created_at': timestamp_us_to_datetime(int(score)),
+        })
+
+
+# Read-only list over cached entries which deserializes an entry the first time it is
+# accessed, so that slicing a page out of a long cached list only decodes that page
+class LazyDeserializedList(Sequence):
+
+    def __init__(self, entries, deserialize):
+        self.entries = entries
+        self.deserialize = deserialize
+        self.objects = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index not in self.objects:
+            self.objects[index] = self.deserialize(self.entries[index])
+        return self.objects[index]
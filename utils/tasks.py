@@ -0,0 +1,9 @@
+from celery import shared_task
+from utils.redis_helper import RedisHelper
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(routing_key='default', time_limit=ONE_HOUR)
+def flush_count_deltas_task():
+    flushed = RedisHelper.flush_count_deltas()
+    return '{} count deltas flushed.'.format(flushed)
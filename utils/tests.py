@@ -1,11 +1,24 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory, override_settings
+from rest_framework.request import Request
 from testing.testcases import TestCase
+from tweets.models import Tweet
+from utils.memcached_helper import MemcachedHelper
+from utils.paginations import EndlessPagination
 from utils.redis_client import RedisClient
+from unittest import mock
+from utils.redis_helper import RedisHelper, REBUILD_LOCK_PATTERN
+from utils.redis_serializers import DjangoModelSortedSetSerializer
+from utils.tasks import flush_count_deltas_task
 
 
 class UtilsTests(TestCase):
 
     def setUp(self):
         RedisClient.clear()
+        self.factory = RequestFactory()
 
     def test_redis_client(self):
         # Save key/value pairs to redis by pushing from the left
@@ -19,3 +32,293 @@ class UtilsTests(TestCase):
         RedisClient.clear()
         cached_list = conn.lrange('redis_key', 0, -1)
         self.assertEqual(cached_list, [])
+
+    def test_named_redis_clients(self):
+        # Every logical client is created once with its own connection pool
+        feeds_conn = RedisClient.get_connection('feeds')
+        counters_conn = RedisClient.get_connection('counters')
+        self.assertIs(RedisClient.get_connection('feeds'), feeds_conn)
+        self.assertIsNot(feeds_conn.connection_pool, counters_conn.connection_pool)
+        with self.assertRaises(Exception):
+            RedisClient.get_connection('unknown')
+
+        # Clients are configured per name on top of the shared defaults
+        with override_settings(REDIS_CLIENTS={'feeds': {'DB': 5, 'MAX_CONNECTIONS': 3}}):
+            config = RedisClient.get_config('feeds')
+        self.assertEqual(config['DB'], 5)
+        self.assertEqual(config['MAX_CONNECTIONS'], 3)
+        self.assertEqual(config['PORT'], settings.REDIS_PORT)
+
+    @override_settings(REDIS_REBUILD_WAIT_RETRIES=1, REDIS_REBUILD_WAIT_INTERVAL=0)
+    def test_single_flight_rebuild(self):
+        user = self.create_user('zhekang')
+        tweets = [self.create_tweet(user) for _ in range(3)]
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at', '-id')
+        serializer = DjangoModelSortedSetSerializer
+        conn = RedisClient.get_connection('feeds')
+
+        # While another process holds the lock, DB is read but the key is not written
+        conn.set(REBUILD_LOCK_PATTERN.format(key='tweets'), 'token')
+        objects = RedisHelper.load_sorted_objects('tweets', queryset, serializer)
+        self.assertEqual([obj.id for obj in objects], [tweet.id for tweet in tweets[::-1]])
+        self.assertFalse(conn.exists('tweets'))
+        RedisHelper.push_single_sorted_object('tweets', tweets[0], queryset, serializer)
+        self.assertFalse(conn.exists('tweets'))
+
+        # The lock holder builds the key once and releases its own lock only
+        conn.delete(REBUILD_LOCK_PATTERN.format(key='tweets'))
+        RedisHelper.load_sorted_objects('tweets', queryset, serializer)
+        self.assertEqual(conn.zcard('tweets'), 3)
+        self.assertFalse(conn.exists(REBUILD_LOCK_PATTERN.format(key='tweets')))
+        with self.assertNumQueries(0):
+            objects = RedisHelper.load_sorted_objects('tweets', queryset, serializer)
+        self.assertEqual([obj.id for obj in objects], [tweet.id for tweet in tweets[::-1]])
+
+        # A rebuild replaces the whole sorted set instead of adding to it
+        conn.zadd('tweets', {b'stale': 1})
+        RedisHelper._load_sorted_objects_to_cache('tweets', queryset, serializer)
+        self.assertEqual(conn.zcard('tweets'), 3)
+
+    def test_load_sorted_objects_range(self):
+        user = self.create_user('zhekang')
+        tweets = [self.create_tweet(user) for _ in range(6)]
+        # Tweets created at the same time are ordered by id
+        Tweet.objects.filter(id__in=[tweets[2].id, tweets[3].id]).update(created_at=tweets[2].created_at)
+        tweets = list(Tweet.objects.filter(user=user).order_by('-created_at', '-id'))
+        tweet_ids = [tweet.id for tweet in tweets]
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at', '-id')
+        serializer = DjangoModelSortedSetSerializer
+
+        def load_range(**kwargs):
+            objects, complete = RedisHelper.load_sorted_objects_range('tweets', queryset, serializer, **kwargs)
+            self.assertTrue(complete)
+            return [obj.id for obj in objects]
+
+        # The same ranges are returned when the cache is rebuilt and when it is read
+        for _ in range(2):
+            self.assertEqual(load_range(count=3), tweet_ids[:3])
+            self.assertEqual(load_range(below=serializer.get_sort_key(tweets[2]), count=2), tweet_ids[3:5])
+            self.assertEqual(load_range(below=serializer.get_sort_key(tweets[3])), tweet_ids[4:])
+            self.assertEqual(load_range(above=serializer.get_score(tweets[2])), tweet_ids[:2])
+
+        # Only the requested range is deserialized from the cache
+        with mock.patch.object(serializer, 'deserialize', wraps=serializer.deserialize) as deserialize:
+            load_range(count=2)
+        self.assertEqual(deserialize.call_count, 2)
+
+    def test_paginate_cached_range(self):
+        user = self.create_user('zhekang')
+        page_size = 3
+        tweets = [self.create_tweet(user) for _ in range(page_size * 3 + 1)]
+        # Tweets created at the same time are ordered by id
+        Tweet.objects.filter(id__in=[tweet.id for tweet in tweets[2:6]]).update(created_at=tweets[2].created_at)
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at', '-id')
+        tweet_ids = list(queryset.values_list('id', flat=True))
+        serializer = DjangoModelSortedSetSerializer
+
+        def load_range(**kwargs):
+            return RedisHelper.load_sorted_objects_range('tweets', queryset, serializer, **kwargs)
+
+        # Only page_size + 1 entries are deserialized for a page
+        RedisHelper.load_sorted_objects('tweets', queryset, serializer)
+        paginator = EndlessPagination()
+        paginator.page_size = page_size
+        with mock.patch.object(serializer, 'deserialize', wraps=serializer.deserialize) as deserialize:
+            paginator.paginate_cached_range(load_range, Request(self.factory.get('/')))
+        self.assertEqual(deserialize.call_count, page_size + 1)
+
+        # Pages are walked with the cursor without duplicates or gaps
+        results, params = [], {}
+        while True:
+            paginator = EndlessPagination()
+            paginator.page_size = page_size
+            page = paginator.paginate_cached_range(load_range, Request(self.factory.get('/', params)))
+            results.extend(obj.id for obj in page)
+            if not paginator.has_next_page:
+                break
+            params = {'cursor': paginator.next_cursor}
+        self.assertEqual(results, tweet_ids)
+
+        # A truncated cache which runs out of objects leaves the rest of the page to DB
+        paginator = EndlessPagination()
+        paginator.page_size = page_size
+        with override_settings(REDIS_LIST_LENGTH_LIMIT=page_size - 1):
+            RedisClient.clear()
+            page = paginator.paginate_cached_range(load_range, Request(self.factory.get('/')))
+        self.assertIsNone(page)
+
+    def test_truncated_sorted_set(self):
+        user = self.create_user('zhekang')
+        limit = settings.REDIS_LIST_LENGTH_LIMIT
+        tweets = [self.create_tweet(user) for _ in range(limit + 1)]
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at', '-id')
+        serializer = DjangoModelSortedSetSerializer
+        conn = RedisClient.get_connection('feeds')
+
+        # A sorted set loaded up to the length limit is truncated
+        objects, complete = RedisHelper.load_sorted_objects_range('tweets', queryset, serializer)
+        self.assertEqual(len(objects), limit)
+        self.assertFalse(complete)
+
+        # Removals keep the key and the marker, the objects beyond it are still only in DB
+        RedisHelper.remove_sorted_object('tweets', tweets[-1], serializer)
+        RedisHelper.remove_sorted_object('tweets', tweets[-2], serializer)
+        objects, complete = RedisHelper.load_sorted_objects_range('tweets', queryset, serializer)
+        self.assertEqual(len(objects), limit - 2)
+        self.assertFalse(complete)
+        self.assertEqual(
+            [obj.id for obj in RedisHelper.load_sorted_objects('tweets', queryset, serializer)],
+            [obj.id for obj in objects],
+        )
+
+        # Pushing beyond the length limit keeps the marker
+        for tweet in [self.create_tweet(user) for _ in range(3)]:
+            RedisHelper.push_single_sorted_object('tweets', tweet, queryset, serializer)
+        objects, complete = RedisHelper.load_sorted_objects_range('tweets', queryset, serializer)
+        self.assertEqual(len(objects), limit)
+        self.assertFalse(complete)
+        self.assertEqual(conn.zcard('tweets'), limit + 1)
+
+        # A sorted set holding every object stays complete after removals, and becomes
+        # truncated once a push drops its oldest object
+        conn.delete('tweets')
+        queryset = Tweet.objects.filter(id__in=[tweet.id for tweet in tweets[:limit]]).order_by('-created_at', '-id')
+        RedisHelper.load_sorted_objects_range('tweets', queryset[1:], serializer)
+        RedisHelper.remove_sorted_object('tweets', tweets[0], serializer)
+        objects, complete = RedisHelper.load_sorted_objects_range('tweets', queryset, serializer)
+        self.assertEqual(len(objects), limit - 2)
+        self.assertTrue(complete)
+        for tweet in [self.create_tweet(user) for _ in range(3)]:
+            RedisHelper.push_single_sorted_object('tweets', tweet, queryset, serializer)
+        objects, complete = RedisHelper.load_sorted_objects_range('tweets', queryset, serializer)
+        self.assertEqual(len(objects), limit)
+        self.assertFalse(complete)
+
+    def test_get_instances_via_cache(self):
+        users = [self.create_user('user{}'.format(i)) for i in range(3)]
+        user_ids = [user.id for user in users]
+
+        # Missed instances are loaded in one query and cached
+        with self.assertNumQueries(1):
+            instances = MemcachedHelper.get_instances_via_cache(User, user_ids)
+        self.assertEqual(set(instances.keys()), set(user_ids))
+        with self.assertNumQueries(0):
+            instances = MemcachedHelper.get_instances_via_cache(User, user_ids)
+        self.assertEqual(instances[users[0].id].username, 'user0')
+
+    def test_request_cache(self):
+        user = self.create_user('zhekang')
+        with MemcachedHelper.request_cache():
+            cached_user = MemcachedHelper.get_instance_via_cache(User, user.id)
+
+            # Served in process without memcached or DB within the request
+            caches['testing'].clear()
+            with self.assertNumQueries(0):
+                self.assertIs(MemcachedHelper.get_instance_via_cache(User, user.id), cached_user)
+                instances = MemcachedHelper.get_instances_via_cache(User, [user.id])
+                self.assertIs(instances[user.id], cached_user)
+
+            # Invalidation also drops the in-process copy
+            user.username = 'zhekang_peng'
+            user.save()
+            cached_user = MemcachedHelper.get_instance_via_cache(User, user.id)
+            self.assertEqual(cached_user.username, 'zhekang_peng')
+
+        # Disabled out of the request scope
+        caches['testing'].clear()
+        with self.assertNumQueries(1):
+            MemcachedHelper.get_instance_via_cache(User, user.id)
+
+    def test_counts(self):
+        user = self.create_user('zhekang')
+        tweet = self.create_tweet(user)
+        another_tweet = self.create_tweet(user)
+
+        # Counters are changed in DB as well, a cold one is initialized from DB
+        Tweet.objects.filter(id=tweet.id).update(likes_count=1)
+        self.assertEqual(RedisHelper.incr_count(Tweet(id=tweet.id), 'likes_count'), 2)
+        self.assertEqual(RedisHelper.incr_count(tweet, 'likes_count'), 3)
+        self.assertEqual(RedisHelper.decr_count(tweet, 'likes_count'), 2)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 2)
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 2)
+
+        # Cached counters are read without DB, missed ones are backfilled in one query
+        Tweet.objects.filter(id=another_tweet.id).update(likes_count=5)
+        with self.assertNumQueries(1):
+            counts = RedisHelper.get_counts([tweet, another_tweet], 'likes_count')
+        self.assertEqual(counts, [2, 5])
+        with self.assertNumQueries(0):
+            counts = RedisHelper.get_counts([tweet, another_tweet], 'likes_count')
+        self.assertEqual(counts, [2, 5])
+
+        # A cached counter is read from Redis only, DB is not read again
+        conn = RedisClient.get_connection('counters')
+        key = RedisHelper.get_count_key(tweet, 'comments_count')
+        self.assertEqual(RedisHelper.get_count(tweet, 'comments_count'), 0)
+        Tweet.objects.filter(id=tweet.id).update(comments_count=3)
+        self.assertEqual(RedisHelper.incr_count(tweet, 'comments_count'), 1)
+
+        # While a change is in flight, DB may or may not include it, the count is not cached
+        conn.delete(key)
+        RedisHelper._begin_count_write(conn, RedisHelper.get_count_writes_key(key))
+        self.assertEqual(RedisHelper.get_count(tweet, 'comments_count'), 4)
+        self.assertEqual(conn.exists(key), False)
+        conn.hincrby(RedisHelper.get_count_writes_key(key), 'inflight', -1)
+        self.assertEqual(RedisHelper.get_counts([tweet], 'comments_count'), [4])
+        self.assertEqual(conn.exists(key), True)
+
+    @override_settings(COUNTER_WRITE_BEHIND=True)
+    def test_write_behind_counts(self):
+        user = self.create_user('zhekang')
+        tweet = self.create_tweet(user)
+        for i in range(3):
+            self.create_like(self.create_user('user{}'.format(i)), tweet)
+        comment = self.create_comment(user, tweet.id)
+        self.create_like(user, comment)
+
+        # Redis is the authority, DB rows are not touched by the listeners
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 0)
+        self.assertEqual(tweet.comments_count, 0)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 3)
+        self.assertEqual(RedisHelper.get_count(tweet, 'comments_count'), 1)
+
+        # A cold counter includes the deltas waiting to be flushed
+        conn = RedisClient.get_connection('counters')
+        conn.delete(RedisHelper.get_count_key(tweet, 'likes_count'))
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 3)
+        conn.delete(RedisHelper.get_count_key(comment, 'likes_count'))
+        self.assertEqual(RedisHelper.get_counts([comment], 'likes_count'), [1])
+
+        flush_count_deltas_task()
+        tweet.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 3)
+        self.assertEqual(tweet.comments_count, 1)
+        self.assertEqual(comment.likes_count, 1)
+
+        # Flushed deltas are not applied twice, new ones keep accumulating
+        conn.delete(RedisHelper.get_count_key(tweet, 'likes_count'))
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 3)
+        self.create_like(user, tweet)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 4)
+        flush_count_deltas_task()
+        flush_count_deltas_task()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 4)
+
+        # A flush stopped before deleting the deltas it applied flushes them again, rows
+        # which have reached their generation are skipped and cold counters skip them too
+        self.create_like(self.create_user('another_user'), tweet)
+        with mock.patch.object(conn, 'delete'):
+            flush_count_deltas_task()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 5)
+        conn.delete(RedisHelper.get_count_key(tweet, 'likes_count'))
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 5)
+        conn.delete(RedisHelper.get_count_key(tweet, 'likes_count'))
+        self.assertEqual(RedisHelper.get_counts([tweet], 'likes_count'), [5])
+        flush_count_deltas_task()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 5)
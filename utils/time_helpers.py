@@ -1,5 +1,17 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 
 def utc_now():
-    return datetime.now().replace(tzinfo=pytz.utc)
\ No newline at end of file
+    return datetime.now().replace(tzinfo=pytz.utc)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+
+def datetime_to_timestamp_us(dt):
+    # Integer arithmetic keeps the microseconds exact, float timestamp() does not
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def timestamp_us_to_datetime(timestamp_us):
+    return EPOCH + timedelta(microseconds=timestamp_us)